@@ -1,66 +1,327 @@
-import cv2
 import numpy as np
 from PIL import Image
 import pandas as pd
+import io
 import os
-from functools import lru_cache
-from typing import Dict, Optional
+import pickle
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from features import extract_features
 
 # --------------------------------------------------------------------
 # CONFIG
 # --------------------------------------------------------------------
 DATASET_PATH = "Hackathon_dataset.xlsx"
+# Pickled copy of the parsed xlsx, rebuilt whenever the xlsx changes
+DATASET_SNAPSHOT = "Hackathon_dataset.snapshot.pkl"
+DATASET_WATCH_INTERVAL = 2.0  # seconds between xlsx mtime checks
+
+# Longest side (in pixels) the analyzer works at. Larger uploads are decoded
+# at reduced resolution; set to None to always analyze at full resolution.
+MAX_ANALYSIS_SIDE = 2048
+
+# (version, dataset, recommendation index) - always replaced as a whole
+_catalog: Tuple[int, Optional[pd.DataFrame], Optional[Dict]] = (0, None, None)
+_catalog_source: Optional[Tuple[int, int]] = None
+_catalog_lock = threading.Lock()
+_reload_listeners: List[Callable[[int], None]] = []
 
 
 # --------------------------------------------------------------------
 # DATA LOADING
 # --------------------------------------------------------------------
-@lru_cache(maxsize=1)
-def load_dataset() -> Optional[pd.DataFrame]:
+def _source_stamp() -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of the xlsx, or None if it is missing."""
+    try:
+        st = os.stat(DATASET_PATH)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_dataset(stamp: Optional[Tuple[int, int]]) -> Optional[pd.DataFrame]:
     """
-    Load the Gliss product dataset once and cache it in memory.
+    Read the catalog from the compiled snapshot when it was built from the
+    current xlsx; otherwise parse the xlsx and recompile the snapshot.
     """
-    if not os.path.exists(DATASET_PATH):
+    try:
+        with open(DATASET_SNAPSHOT, "rb") as f:
+            snapshot = pickle.load(f)
+        if stamp is None or tuple(snapshot["source"]) == stamp:
+            return snapshot["df"]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable dataset snapshot: {e}")
+
+    if stamp is None:
         print(f"⚠️ Dataset not found at {DATASET_PATH}")
         return None
 
     try:
         df = pd.read_excel(DATASET_PATH)
         df.columns = df.columns.str.strip()
-        print(f"✓ Loaded {len(df)} Gliss products from dataset")
-        return df
     except Exception as e:
         print(f"⚠️ Could not load dataset: {e}")
         return None
 
+    tmp = f"{DATASET_SNAPSHOT}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump({"source": stamp, "df": df}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, DATASET_SNAPSHOT)
+    except OSError as e:
+        print(f"⚠️ Could not write dataset snapshot: {e}")
+    return df
+
+
+def reload_dataset(force: bool = False) -> bool:
+    """
+    Rebuild the catalog if the xlsx changed since it was loaded and swap it
+    in atomically; readers keep the old catalog until the new one is ready.
+    A failed reload keeps serving the previous catalog.
+    Returns True when a new catalog was swapped in.
+    """
+    global _catalog, _catalog_source
+    with _catalog_lock:
+        version, old_df, _ = _catalog
+        stamp = _source_stamp()
+        if version and not force and stamp == _catalog_source:
+            return False
+
+        df = _read_dataset(stamp)
+        if df is None and old_df is not None:
+            # Keep the old catalog; retry once the file changes again
+            _catalog_source = stamp
+            return False
+
+        index = None
+        if df is not None:
+            try:
+                index = build_recommendation_index(df)
+            except Exception as e:
+                print(f"⚠️ Could not build recommendation index: {e}")
+            print(f"✓ Loaded {len(df)} Gliss products from dataset")
+
+        _catalog = (version + 1, df, index)
+        _catalog_source = stamp
+        version = _catalog[0]
+
+    for listener in list(_reload_listeners):
+        try:
+            listener(version)
+        except Exception as e:
+            print(f"⚠️ Dataset reload listener failed: {e}")
+    return True
+
+
+def get_catalog() -> Tuple[int, Optional[pd.DataFrame]]:
+    """Return (version, dataset) from one consistent catalog snapshot."""
+    if not _catalog[0]:
+        reload_dataset()
+    version, df, _ = _catalog
+    return version, df
+
+
+def dataset_version() -> int:
+    """Version of the current catalog; bumped on every hot reload."""
+    return get_catalog()[0]
+
+
+def load_dataset() -> Optional[pd.DataFrame]:
+    """
+    Load the Gliss product dataset once and cache it in memory.
+    """
+    return get_catalog()[1]
+
+
+def on_dataset_reload(callback: Callable[[int], None]) -> None:
+    """Register `callback(version)` to run after each catalog swap."""
+    _reload_listeners.append(callback)
+
+
+def watch_dataset(
+    interval: float = DATASET_WATCH_INTERVAL, stop: Optional[threading.Event] = None
+) -> threading.Thread:
+    """Start a daemon thread that hot-reloads the catalog when the xlsx changes."""
+    stop = stop or threading.Event()
+
+    def poll():
+        while not stop.wait(interval):
+            try:
+                reload_dataset()
+            except Exception as e:
+                print(f"⚠️ Dataset watcher error: {e}")
+
+    thread = threading.Thread(target=poll, name="dataset-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+def build_recommendation_index(df: pd.DataFrame) -> Dict:
+    """
+    Precompute product lookups from the dataset so requests never filter it.
+
+    "shampoo" maps (care level code, texture) to the first matching shampoo
+    ({"product", "key_ingredients", "benefit"}), or None when that texture
+    exists for the level but has no shampoo. (care level code, None) holds
+    the first shampoo of the level, used for textures it doesn't list.
+    "products" maps a product name to its shampoo/conditioner records.
+    """
+    def recommendation(rows: pd.DataFrame) -> Optional[Dict]:
+        shampoo = rows[rows['Product Type'] == 'Shampoo']
+        if shampoo.empty:
+            return None
+        row = shampoo.iloc[0]
+        return {
+            "product": row['Product'],
+            "key_ingredients": row['Key Ingredients'],
+            "benefit": row['Benefit from Ingredient'],
+        }
+
+    shampoo_index = {}
+    for code, level_rows in df.groupby('Care Level Code', sort=False):
+        code = int(code)
+        shampoo_index[(code, None)] = recommendation(level_rows)
+        for texture, rows in level_rows.groupby('Hair Texture', sort=False):
+            shampoo_index[(code, texture)] = recommendation(rows)
+
+    products = {
+        name: {
+            "shampoo": rows[rows['Product Type'] == 'Shampoo'].to_dict('records'),
+            "conditioner": rows[rows['Product Type'] == 'Conditioner'].to_dict('records'),
+        }
+        for name, rows in df.groupby('Product', sort=False)
+    }
+
+    return {"shampoo": shampoo_index, "products": products}
+
+
+def load_recommendation_index() -> Optional[Dict]:
+    """Return the recommendation index built alongside the current catalog."""
+    if not _catalog[0]:
+        reload_dataset()
+    return _catalog[2]
+
 
 # --------------------------------------------------------------------
-# MAIN ANALYSIS FUNCTION
+# IMAGE DECODING
 # --------------------------------------------------------------------
-def analyze_hair_balanced(image: Image.Image) -> Dict:
+def prepare_image(
+    image: Image.Image, max_side: Optional[int] = MAX_ANALYSIS_SIDE
+) -> Tuple[np.ndarray, float]:
     """
-    Perform advanced hair damage analysis and recommend Gliss products.
-    Framework-agnostic: no Streamlit dependencies.
+    Decode an image to an RGB array whose longest side is at most `max_side`.
+
+    The image is shrunk by the smallest power-of-two factor that fits, so
+    the analyzed side ends up between max_side / 2 and max_side. For a
+    freshly opened JPEG, draft mode makes libjpeg decode directly at that
+    scale (up to 1/8), so the full-size pixels are never materialized;
+    other formats are decoded and then box-filtered down.
+
+    Returns the array and the linear scale (analysis width / original width).
+    """
+    width, height = image.size
+    longest = max(width, height)
+    if not max_side or longest <= max_side:
+        return np.array(image.convert("RGB")), 1.0
+
+    factor = 2
+    while -(-longest // factor) > max_side:
+        factor *= 2
+    target = (-(-width // factor), -(-height // factor))
+
+    # draft() only scales down while the result stays at least the requested
+    # size; libjpeg rounds scaled sizes up, so ask for the rounded-down size
+    image.draft("RGB", (max(1, width // factor), max(1, height // factor)))
+    image = image.convert("RGB")
+    if image.size != target:
+        image = image.resize(target, Image.Resampling.BOX, reducing_gap=2.0)
+
+    return np.array(image), image.size[0] / width
+
+
+# --------------------------------------------------------------------
+# CLASSIFICATION & PRODUCT MATCHING
+# --------------------------------------------------------------------
+def classify_damage(score: float) -> Tuple[str, str, str, str, str]:
+    """Map a damage score to (level, care_level, hair_type, primary_concern, message)."""
+    if score < 3.5:
+        return ("Healthy", "Gentle", "Normal & Fine", "Moisture",
+                "Smooth surface and consistent tone — minimal damage detected.")
+    if score < 6.5:
+        return ("Moderate Damage", "Medium", "Dry, Damaged", "Nourishment",
+                "Some uneven shine and slight dryness detected — mild repair suggested.")
+    return ("Severe Damage", "Deep Care", "Heavily Damaged & Dry", "Breakage",
+            "High texture variation and dull tone — deep treatment recommended.")
+
+
+def match_product(
+    care_level: str, detected_texture: str, score: float
+) -> Tuple[str, str, str, int]:
     """
-    img = np.array(image.convert("RGB"))
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
+    Pick the Gliss shampoo for a care level and texture.
+    Returns (product, key_ingredients, benefit, confidence).
+    """
+    index = load_recommendation_index()
+    confidence = 90
+    recommended_product, key_ingredients, benefit = None, None, None
+
+    if index is not None:
+        care_level_map = {"Gentle": 1, "Medium": 2, "Deep Care": 3}
+        target_code = care_level_map.get(care_level, 2)
+
+        shampoos = index["shampoo"]
+        key = (target_code, detected_texture)
+        match = shampoos[key] if key in shampoos else shampoos.get((target_code, None))
+        if match is not None:
+            recommended_product = match["product"]
+            key_ingredients = match["key_ingredients"]
+            benefit = match["benefit"]
+            confidence = 95
+
+    # --- Default fallback ---
+    if recommended_product is None:
+        if score < 3:
+            recommended_product = "Aqua Revive"
+            key_ingredients = "Marine Algae, Hyaluron Complex"
+            benefit = "Seals Moisture"
+        elif score < 7:
+            recommended_product = "Oil Nutritive"
+            key_ingredients = "Marula Oil, Omega 9"
+            benefit = "Controls Water Loss"
+        else:
+            recommended_product = "Ultimate Repair"
+            key_ingredients = "Black Pearl, Liquid Keratin"
+            benefit = "Repairing Damage"
 
-    # --- Normalize lighting ---
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    norm_gray = clahe.apply(gray)
+    return recommended_product, key_ingredients, benefit, confidence
 
-    # --- Core features ---
-    sobelx = cv2.Sobel(norm_gray, cv2.CV_64F, 1, 0, ksize=3)
-    sobely = cv2.Sobel(norm_gray, cv2.CV_64F, 0, 1, ksize=3)
-    edge_magnitude = np.sqrt(sobelx**2 + sobely**2)
-    texture_score = np.var(edge_magnitude) / 15000
-    edge_density = np.mean(edge_magnitude > 50) * 100
 
-    brightness = np.mean(norm_gray) / 255.0
-    saturation_std = np.std(hsv[:, :, 1]) / 128.0
-    highlight_ratio = np.mean(norm_gray > 200)
-    color_diff = np.std(hsv[:, :, 2]) / 128.0
+# --------------------------------------------------------------------
+# MAIN ANALYSIS FUNCTION
+# --------------------------------------------------------------------
+def analyze_hair_balanced(
+    image: Image.Image, max_side: Optional[int] = MAX_ANALYSIS_SIDE
+) -> Dict:
+    """
+    Perform advanced hair damage analysis and recommend Gliss products.
+    Framework-agnostic: no Streamlit dependencies.
+
+    Images larger than `max_side` are analyzed at reduced resolution; edge
+    features are rescaled so they stay comparable to a full-resolution scan.
+    Raw features come from features.extract_features.
+    """
+    img, scale = prepare_image(image, max_side)
+    features = extract_features(img, scale)
+    texture_score = features["texture_score"]
+    edge_density = features["edge_density"]
+    brightness = features["brightness"]
+    saturation_std = features["saturation_std"]
+    highlight_ratio = features["highlight_ratio"]
+    color_diff = features["color_std"]
 
     # --- Calculate raw score ---
     raw_score = (
@@ -87,59 +348,10 @@ def analyze_hair_balanced(image: Image.Image) -> Dict:
     else:
         detected_texture = "Medium"
 
-    # --- Classification ---
-    if score < 3.5:
-        level, care_level = "Healthy", "Gentle"
-        hair_type, primary_concern = "Normal & Fine", "Moisture"
-        msg = "Smooth surface and consistent tone — minimal damage detected."
-    elif score < 6.5:
-        level, care_level = "Moderate Damage", "Medium"
-        hair_type, primary_concern = "Dry, Damaged", "Nourishment"
-        msg = "Some uneven shine and slight dryness detected — mild repair suggested."
-    else:
-        level, care_level = "Severe Damage", "Deep Care"
-        hair_type, primary_concern = "Heavily Damaged & Dry", "Breakage"
-        msg = "High texture variation and dull tone — deep treatment recommended."
-
-    # --- Product Matching ---
-    df = load_dataset()
-    confidence = 90
-    recommended_product, key_ingredients, benefit = None, None, None
-
-    if df is not None:
-        try:
-            care_level_map = {"Gentle": 1, "Medium": 2, "Deep Care": 3}
-            target_code = care_level_map.get(care_level, 2)
-
-            matched = df[df['Care Level Code'] == target_code]
-            texture_matched = matched[matched['Hair Texture'] == detected_texture]
-            if texture_matched.empty:
-                texture_matched = matched
-
-            shampoo = texture_matched[texture_matched['Product Type'] == 'Shampoo']
-            if not shampoo.empty:
-                row = shampoo.iloc[0]
-                recommended_product = row['Product']
-                key_ingredients = row['Key Ingredients']
-                benefit = row['Benefit from Ingredient']
-                confidence = 95
-        except Exception as e:
-            print(f"⚠️ Product matching error: {e}")
-
-    # --- Default fallback ---
-    if recommended_product is None:
-        if score < 3:
-            recommended_product = "Aqua Revive"
-            key_ingredients = "Marine Algae, Hyaluron Complex"
-            benefit = "Seals Moisture"
-        elif score < 7:
-            recommended_product = "Oil Nutritive"
-            key_ingredients = "Marula Oil, Omega 9"
-            benefit = "Controls Water Loss"
-        else:
-            recommended_product = "Ultimate Repair"
-            key_ingredients = "Black Pearl, Liquid Keratin"
-            benefit = "Repairing Damage"
+    level, care_level, hair_type, primary_concern, msg = classify_damage(score)
+    recommended_product, key_ingredients, benefit, confidence = match_product(
+        care_level, detected_texture, score
+    )
 
     return {
         "damage_score": round(float(score), 1),  # ✅ Flutter-friendly key name
@@ -163,24 +375,63 @@ def analyze_hair_balanced(image: Image.Image) -> Dict:
 
 
 # --------------------------------------------------------------------
-# PRODUCT DETAILS FUNCTIONS
+# BATCH ANALYSIS
 # --------------------------------------------------------------------
-def get_product_details(product_name: str) -> Optional[Dict]:
-    """Return shampoo/conditioner details for a product name."""
-    df = load_dataset()
-    if df is None or not product_name:
-        return None
+def analyze_image_bytes(data: bytes) -> Dict:
+    """
+    Decode and analyze raw upload bytes.
+    Top-level and picklable so it can run inside a worker process.
+    """
+    return analyze_hair_balanced(Image.open(io.BytesIO(data)))
 
-    products = df[df['Product'] == product_name]
-    if products.empty:
+
+def aggregate_results(results: List[Dict]) -> Optional[Dict]:
+    """
+    Combine per-image results (e.g. roots, mid-lengths, ends) into one verdict.
+    The mean damage score drives classification; the most common texture
+    drives product matching.
+    """
+    if not results:
         return None
 
+    score = sum(r["damage_score"] for r in results) / len(results)
+    textures = Counter(r["detected_texture"] for r in results)
+    detected_texture = textures.most_common(1)[0][0]
+
+    level, care_level, hair_type, primary_concern, msg = classify_damage(score)
+    recommended_product, key_ingredients, benefit, confidence = match_product(
+        care_level, detected_texture, score
+    )
+
     return {
-        "shampoo": products[products['Product Type'] == 'Shampoo'].to_dict('records'),
-        "conditioner": products[products['Product Type'] == 'Conditioner'].to_dict('records')
+        "damage_score": round(float(score), 1),
+        "level": level,
+        "confidence": confidence,
+        "message": msg,
+        "detected_texture": detected_texture,
+        "recommended_product": recommended_product,
+        "key_ingredients": key_ingredients,
+        "benefit": benefit,
+        "hair_type": hair_type,
+        "primary_concern": primary_concern,
+        "care_level": care_level,
+        "best_score": min(r["damage_score"] for r in results),
+        "worst_score": max(r["damage_score"] for r in results),
+        "images_analyzed": len(results),
     }
 
 
+# --------------------------------------------------------------------
+# PRODUCT DETAILS FUNCTIONS
+# --------------------------------------------------------------------
+def get_product_details(product_name: str) -> Optional[Dict]:
+    """Return shampoo/conditioner details for a product name."""
+    index = load_recommendation_index()
+    if index is None or not product_name:
+        return None
+    return index["products"].get(product_name)
+
+
 def get_all_products() -> Optional[pd.DataFrame]:
     """Return the complete Gliss product dataset."""
     return load_dataset()
@@ -0,0 +1,274 @@
+"""
+Benchmarks and parity checks for the Gliss Mirror backend.
+
+Usage:
+    python benchmark.py resolution [image ...]
+    python benchmark.py features [image ...]
+    python benchmark.py sanitize [text file ...]
+
+Without image paths, synthetic 12 MP hair-like JPEGs are generated; without
+text files, sample Maya replies are used.
+Exits non-zero if a parity check falls outside its stated tolerance.
+"""
+import argparse
+import io
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import analyzer
+import features
+import sanitizer
+
+# --------------------------------------------------------------------
+# SAMPLE IMAGES
+# --------------------------------------------------------------------
+def synthetic_hair(width: int = 4000, height: int = 3000, strand: float = 6.0, seed: int = 0) -> bytes:
+    """Render wavy brown strands with sensor noise and encode them as a JPEG."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    wave = np.sin(x / 300.0 + rng.uniform(0, 6)) * 0.6
+    value = np.sin((x * 0.3 + y + wave * 300) / strand) * 40 + 120
+    noise = rng.normal(0, 10, (height, width)).astype(np.float32)
+    value += cv2.GaussianBlur(noise, (0, 0), 1.5)
+    value *= 1 - 0.3 * (y / height - 0.5) ** 2
+    value = np.clip(value, 0, 255)
+    rgb = np.stack([value, value * 0.8, value * 0.55], axis=-1).astype(np.uint8)
+
+    buf = io.BytesIO()
+    Image.fromarray(rgb).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def load_samples(paths: List[str]) -> List[Tuple[str, bytes]]:
+    if paths:
+        samples = []
+        for path in paths:
+            with open(path, "rb") as f:
+                samples.append((path, f.read()))
+        return samples
+    samples = [(f"synthetic strand={s}", synthetic_hair(strand=s, seed=s)) for s in (4, 6, 9, 12)]
+    # Odd and non-4:3 sizes, where rounding decides whether JPEG draft applies
+    samples += [
+        (f"synthetic {w}x{h}", synthetic_hair(w, h, seed=w + h))
+        for w, h in ((4001, 3001), (5000, 2001), (3001, 4001))
+    ]
+    return samples
+
+
+def timed(fn: Callable, *args, repeat: int = 3, **kwargs):
+    """Return (best wall time in ms, last result)."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+# --------------------------------------------------------------------
+# RESOLUTION PARITY
+# --------------------------------------------------------------------
+# Maximum allowed |bounded - full| per returned feature
+RESOLUTION_TOLERANCE: Dict[str, float] = {
+    "damage_score": 0.5,
+    "edge_density": 5.0,
+    "texture_score": 0.05,
+    "brightness": 0.01,
+    "saturation_std": 0.01,
+    "highlight_ratio": 0.01,
+    "color_std": 0.01,
+}
+
+
+def bench_resolution(paths: List[str]) -> bool:
+    """Compare bounded-resolution analysis against a full-resolution run."""
+    ok = True
+    for name, data in load_samples(paths):
+        full_ms, full = timed(lambda: analyzer.analyze_hair_balanced(Image.open(io.BytesIO(data)), max_side=None))
+        fast_ms, fast = timed(lambda: analyzer.analyze_hair_balanced(Image.open(io.BytesIO(data))))
+        print(f"{name}: full {full_ms:.1f} ms, bounded {fast_ms:.1f} ms ({full_ms / fast_ms:.1f}x)")
+
+        # draft() resizes the opened image in place, so its size is the decoded size
+        opened = Image.open(io.BytesIO(data))
+        original = opened.size
+        pixels, _ = analyzer.prepare_image(opened)
+        # libjpeg scales by up to 1/8, so a JPEG should decode at the analysis size or 1/8
+        smallest = max(pixels.shape[1], -(-original[0] // 8))
+        decoded_ok = opened.format != "JPEG" or opened.size[0] <= smallest
+        ok &= decoded_ok
+        print(f"    decoded {opened.size[0]}x{opened.size[1]} for analysis at "
+              f"{pixels.shape[1]}x{pixels.shape[0]}  {'ok' if decoded_ok else 'FAIL (oversized decode)'}")
+
+        for key, tol in RESOLUTION_TOLERANCE.items():
+            diff = abs(full[key] - fast[key])
+            status = "ok" if diff <= tol else "FAIL"
+            ok &= diff <= tol
+            print(f"    {key:16s} {full[key]:>9} {fast[key]:>9}  |diff| {diff:.3f} <= {tol}  {status}")
+        if full["detected_texture"] != fast["detected_texture"]:
+            ok = False
+            print(f"    detected_texture {full['detected_texture']} != {fast['detected_texture']}  FAIL")
+    return ok
+
+
+# --------------------------------------------------------------------
+# FEATURE ENGINE
+# --------------------------------------------------------------------
+def legacy_features(img: np.ndarray, scale: float = 1.0) -> Dict[str, float]:
+    """The original float64 Sobel / full-HSV pipeline, kept as a reference."""
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    norm_gray = clahe.apply(gray)
+
+    sobelx = cv2.Sobel(norm_gray, cv2.CV_64F, 1, 0, ksize=3)
+    sobely = cv2.Sobel(norm_gray, cv2.CV_64F, 0, 1, ksize=3)
+    edge_magnitude = np.sqrt(sobelx**2 + sobely**2) * scale
+
+    return {
+        "texture_score": np.var(edge_magnitude) / 15000,
+        "edge_density": np.mean(edge_magnitude > 50) * 100,
+        "brightness": np.mean(norm_gray) / 255.0,
+        "saturation_std": np.std(hsv[:, :, 1]) / 128.0,
+        "highlight_ratio": np.mean(norm_gray > 200),
+        "color_std": np.std(hsv[:, :, 2]) / 128.0,
+    }
+
+
+# Maximum allowed |float32 engine - float64 reference| per raw feature
+FEATURE_TOLERANCE: Dict[str, float] = {
+    "texture_score": 1e-4,
+    "edge_density": 0.01,
+    "brightness": 1e-6,
+    "saturation_std": 0.005,
+    "highlight_ratio": 1e-6,
+    "color_std": 1e-6,
+}
+
+
+def bench_features(paths: List[str]) -> bool:
+    """Time features.extract_features against the legacy pipeline and compare outputs."""
+    ok = True
+    for name, data in load_samples(paths):
+        img, scale = analyzer.prepare_image(Image.open(io.BytesIO(data)))
+        old_ms, old = timed(legacy_features, img, scale, repeat=10)
+        new_ms, new = timed(features.extract_features, img, scale, repeat=10)
+        print(f"{name} @ {img.shape[1]}x{img.shape[0]}: legacy {old_ms:.1f} ms, "
+              f"float32 {new_ms:.1f} ms ({old_ms / new_ms:.1f}x)")
+
+        for key, tol in FEATURE_TOLERANCE.items():
+            diff = abs(float(old[key]) - float(new[key]))
+            status = "ok" if diff <= tol else "FAIL"
+            ok &= diff <= tol
+            print(f"    {key:16s} {float(old[key]):.6f} {float(new[key]):.6f}  |diff| {diff:.2e} <= {tol}  {status}")
+    return ok
+
+
+# --------------------------------------------------------------------
+# TEXT SANITIZER
+# --------------------------------------------------------------------
+def legacy_clean(text: str) -> str:
+    """The original per-call regex / chained replace cleaner, kept as a reference."""
+    emoji_pattern = re.compile(
+        "["
+        "\U0001F600-\U0001F64F"
+        "\U0001F300-\U0001F5FF"
+        "\U0001F680-\U0001F6FF"
+        "\U0001F1E0-\U0001F1FF"
+        "\U00002702-\U000027B0"
+        "\U000024C2-\U0001F251"
+        "\U0001F900-\U0001F9FF"
+        "\U0001FA70-\U0001FAFF"
+        "]+",
+        flags=re.UNICODE
+    )
+    text = emoji_pattern.sub('', text)
+    text = text.replace('**', '').replace('*', '').replace('_', '').replace('`', '')
+    text = text.replace('•', '-').replace('◦', '-').replace('▪', '-')
+    text = text.replace('→', '->').replace('←', '<-')
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+# Characters the new sanitizer removes on purpose where the legacy one kept
+# them: the joiner and keycap left behind by multi-codepoint emoji
+SANITIZE_EXTRA_REMOVED = "\u200d\u20e3"
+
+SAMPLE_REPLIES = [
+    "Hi there! 👋 I'm **Maya**, your _Gliss_ hair expert 💇‍♀️✨\n\n"
+    "• Use **Gliss Ultimate Repair** 2-3 times a week → stronger strands\n"
+    "• Rinse with cool water ◦ avoid heat ▪ trim every `8 weeks`\n\n"
+    "Your hair will thank you! 👩🏽‍🦱❤️ 1️⃣ 🇩🇪",
+    "Great question!   With a damage score of 62, focus on repair.\t"
+    "Apply the mask ← after shampoo, leave it on for 5 minutes. 😊🙌",
+    "Frizz usually means your hair is thirsty. 💧 Try a leave-in conditioner "
+    "and sleep on a silk pillowcase. Avoid brushing dry hair — use a wide-tooth comb! 🌿",
+]
+
+
+def load_texts(paths: List[str]) -> List[Tuple[str, str]]:
+    if paths:
+        texts = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                texts.append((path, f.read()))
+        return texts
+    return [(f"sample reply {i}", text) for i, text in enumerate(SAMPLE_REPLIES)] + [
+        ("all samples x50", "\n".join(SAMPLE_REPLIES) * 50)
+    ]
+
+
+def stream_sanitize(text: str, rng: random.Random) -> str:
+    """Feed `text` to a StreamSanitizer in random 1-8 character chunks."""
+    cleaner, out, i = sanitizer.StreamSanitizer(), [], 0
+    while i < len(text):
+        step = rng.randint(1, 8)
+        out.append(cleaner.feed(text[i:i + step]))
+        i += step
+    return "".join(out)
+
+
+def bench_sanitize(paths: List[str]) -> bool:
+    """Time sanitizer.sanitize against the legacy cleaner; check batch and streamed parity."""
+    ok = True
+    rng = random.Random(0)
+    for name, text in load_texts(paths):
+        old_ms, old = timed(lambda: [legacy_clean(text) for _ in range(100)], repeat=5)
+        new_ms, new = timed(lambda: [sanitizer.sanitize(text) for _ in range(100)], repeat=5)
+        old, new = old[0], new[0]
+        print(f"{name} ({len(text)} chars, x100): legacy {old_ms:.2f} ms, "
+              f"sanitize {new_ms:.2f} ms ({old_ms / new_ms:.1f}x)")
+
+        expected = " ".join(old.translate({ord(c): None for c in SANITIZE_EXTRA_REMOVED}).split())
+        checks = {
+            "batch": new == expected,
+            "streamed": all(stream_sanitize(text, rng) == new for _ in range(20)),
+        }
+        for check, passed in checks.items():
+            ok &= passed
+            print(f"    {check:16s} {'ok' if passed else 'FAIL'}")
+    return ok
+
+
+# --------------------------------------------------------------------
+# MAIN
+# --------------------------------------------------------------------
+BENCHMARKS = {
+    "resolution": bench_resolution,
+    "features": bench_features,
+    "sanitize": bench_sanitize,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("images", nargs="*", help="hair photos (text files for sanitize) to use instead of samples")
+    args = parser.parse_args()
+
+    sys.exit(0 if BENCHMARKS[args.benchmark](args.images) else 1)
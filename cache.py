@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+def json_size(value: Any) -> int:
+    """Approximate memory cost of a JSON-like value by its encoded length."""
+    return len(json.dumps(value, default=str))
+
+
+# --------------------------------------------------------------------
+# LRU CACHE (BOUNDED BY BYTES, WITH TTL)
+# --------------------------------------------------------------------
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by the total size of its values.
+    Entries older than `ttl` seconds are treated as misses.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = json_size,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+# --------------------------------------------------------------------
+# IN-FLIGHT COALESCING
+# --------------------------------------------------------------------
+class SingleFlight:
+    """
+    Coalesce concurrent asyncio work on the same key: while a computation is
+    running, later callers await the same future instead of starting another.
+    """
+
+    def __init__(self):
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: Hashable) -> Optional[asyncio.Future]:
+        return self._futures.get(key)
+
+    def start(self, key: Hashable, work: Awaitable) -> asyncio.Future:
+        """Register `work` as the in-flight computation for `key`."""
+        future = asyncio.ensure_future(work)
+        self._futures[key] = future
+        future.add_done_callback(lambda _: self._futures.pop(key, None))
+        return future
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]) -> Any:
+        """Await the in-flight computation for `key`, starting it if needed."""
+        future = self._futures.get(key) or self.start(key, factory())
+        # Shield so one caller disconnecting does not cancel everyone else
+        return await asyncio.shield(future)
@@ -0,0 +1,98 @@
+import threading
+from typing import Dict, Tuple
+
+import cv2
+import numpy as np
+
+# --------------------------------------------------------------------
+# CONFIG
+# --------------------------------------------------------------------
+EDGE_THRESHOLD = 50        # Sobel magnitude counted as an edge
+HIGHLIGHT_THRESHOLD = 200  # normalized gray level counted as a highlight
+
+_LEVELS = np.arange(256, dtype=np.float64)
+
+# Per-thread scratch space: OpenCV's CLAHE object is not thread-safe, and
+# the float32 buffers are reused across calls with the same image shape.
+_local = threading.local()
+
+
+# --------------------------------------------------------------------
+# HELPERS
+# --------------------------------------------------------------------
+def _clahe():
+    clahe = getattr(_local, "clahe", None)
+    if clahe is None:
+        clahe = _local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe
+
+
+def _float_buffers(shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (grad_x, grad_y, magnitude) float32 buffers for this shape."""
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None or buffers[0].shape != shape:
+        buffers = _local.buffers = tuple(np.empty(shape, np.float32) for _ in range(3))
+    return buffers
+
+
+def _histogram(channel: np.ndarray) -> np.ndarray:
+    """256-bin histogram of a uint8 channel in one pass."""
+    return cv2.calcHist([channel], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+
+
+def _hist_mean_std(hist: np.ndarray) -> Tuple[float, float]:
+    """Mean and population std of the values a histogram describes."""
+    total = hist.sum()
+    mean = float(hist @ _LEVELS) / total
+    var = float(hist @ (_LEVELS * _LEVELS)) / total - mean * mean
+    return mean, float(np.sqrt(max(var, 0.0)))
+
+
+# --------------------------------------------------------------------
+# FEATURE EXTRACTION
+# --------------------------------------------------------------------
+def extract_features(img: np.ndarray, scale: float = 1.0) -> Dict[str, float]:
+    """
+    Compute the analyzer's raw image features from an RGB uint8 array.
+
+    Gradients are float32 written into reused buffers, and every uint8
+    statistic comes from a single 256-bin histogram. Only the S and V
+    channels of HSV are derived. `scale` is the decode scale from
+    analyzer.prepare_image. Edge statistics are reported in
+    full-resolution units.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    norm_gray = _clahe().apply(gray)
+
+    # --- Edges: float32 Sobel + magnitude, mean/std in one pass ---
+    grad_x, grad_y, magnitude = _float_buffers(norm_gray.shape)
+    cv2.Sobel(norm_gray, cv2.CV_32F, 1, 0, grad_x, ksize=3)
+    cv2.Sobel(norm_gray, cv2.CV_32F, 0, 1, grad_y, ksize=3)
+    cv2.magnitude(grad_x, grad_y, magnitude)
+    _, edge_std = cv2.meanStdDev(magnitude)
+    edge_var = float(edge_std[0, 0]) ** 2 * scale * scale
+    # magnitude * scale > threshold, without rescaling the buffer
+    edges = np.count_nonzero(magnitude > EDGE_THRESHOLD / scale)
+
+    # --- Lighting from the normalized gray histogram ---
+    gray_hist = _histogram(norm_gray)
+    brightness, _ = _hist_mean_std(gray_hist)
+    highlights = gray_hist[HIGHLIGHT_THRESHOLD + 1:].sum()
+
+    # --- HSV saturation/value without building the full HSV image ---
+    r, g, b = cv2.split(img)
+    value = cv2.max(cv2.max(r, g), b)
+    spread = cv2.subtract(value, cv2.min(cv2.min(r, g), b))
+    saturation = cv2.divide(spread, value, scale=255)
+    _, saturation_std = _hist_mean_std(_histogram(saturation))
+    _, value_std = _hist_mean_std(_histogram(value))
+
+    pixels = norm_gray.size
+    return {
+        "texture_score": edge_var / 15000,
+        "edge_density": edges / pixels * 100,
+        "brightness": brightness / 255.0,
+        "saturation_std": saturation_std / 128.0,
+        "highlight_ratio": highlights / pixels,
+        "color_std": value_std / 128.0,
+    }
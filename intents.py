@@ -0,0 +1,290 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from maya_chat import CONCERN_KEYWORDS, HAIR_KEYWORDS, get_matching_product, load_match_engine, normalize_question
+
+Label = Tuple[str, str]
+
+# --------------------------------------------------------------------
+# PHRASES
+# --------------------------------------------------------------------
+# Questions answered from the user's scan history; plain substrings, so
+# "currently" routes like "current" (checked in this order)
+ROUTE_PHRASES = {
+    "progress": ["progress", "improvement", "how am i doing", "journey"],
+    "analyze": ["analyze", "latest scan", "my hair", "current"],
+}
+
+# What a question asks about a product line (regex fragments, matched
+# against the normalized question)
+INTENT_PATTERNS = {
+    "ingredients": [r"\bingredients?\b", r"\bwhat s in\b", r"\bwhat is in\b", r"\bmade (?:of|with)\b", r"\bformula\b"],
+    "fragrance": [r"\bsmells?\b", r"\bscents?\b", r"\bfragrance\b", r"\bperfume\b"],
+    "size": [r"\bsizes?\b", r"\bhow big\b", r"\bhow many ml\b", r"\bml\b", r"\bbottles?\b"],
+    "usage": [r"\bhow (?:do|should|can) i use\b", r"\bhow to (?:use|apply)\b", r"\bin what order\b", r"\broutine\b"],
+    "recommend": [r"\brecommend", r"\bsuggest", r"\bwhich\b", r"\bbest\b", r"\bshould i use\b", r"\bwhat (?=shampoo|conditioner|product)"],
+    "about": [r"\bgood for\b", r"\bbenefits?\b", r"\bwho (?:is|s) it for\b", r"\bwhat (?:is|s)\b", r"\bwhat does\b", r"\btell me about\b"],
+}
+
+# Everyday words for concerns, on top of CONCERN_KEYWORDS
+CONCERN_ALIASES = {
+    'oily': 'greasiness',
+    'greasy': 'greasiness',
+    'frizzy': 'frizz',
+    'dull': 'shine',
+    'flat': 'volume',
+    'dry': 'dryness',
+    'damaged': 'damage',
+}
+
+# Intents answered for one product line; anything else needs the model
+LINE_INTENTS = ("ingredients", "fragrance", "size", "usage")
+
+
+# --------------------------------------------------------------------
+# MATCHER
+# --------------------------------------------------------------------
+class IntentMatcher:
+    """
+    Every phrase compiled into one alternation of named groups, so a
+    single regex pass over a question finds all the labels it mentions.
+    """
+
+    def __init__(self, phrases: Dict[Label, List[str]]):
+        self._labels: Dict[str, Label] = {}
+        groups = []
+        for i, (label, patterns) in enumerate(phrases.items()):
+            name = f"g{i}"
+            self._labels[name] = label
+            # Longest first, so "what is in" wins over "what is"
+            groups.append(f"(?P<{name}>{'|'.join(sorted(patterns, key=len, reverse=True))})")
+        self.pattern = re.compile("|".join(groups))
+
+    def labels(self, text: str) -> Set[Label]:
+        return {self._labels[m.lastgroup] for m in self.pattern.finditer(text)}
+
+
+def _word(phrase: str) -> str:
+    return rf"\b{re.escape(phrase)}s?\b"
+
+
+def build_intent_matcher(records: List[Dict]) -> Tuple[IntentMatcher, Dict[str, List[Dict]]]:
+    """Compile the matcher for a catalog; also returns its products grouped by line."""
+    lines: Dict[str, List[Dict]] = {}
+    for record in records:
+        lines.setdefault(record["product_name"], []).append(record)
+
+    phrases: Dict[Label, List[str]] = {}
+    for route, words in ROUTE_PHRASES.items():
+        phrases[("route", route)] = [re.escape(w) for w in words]
+    for intent, patterns in INTENT_PATTERNS.items():
+        phrases[("intent", intent)] = patterns
+    for line in lines:
+        phrases[("line", line)] = [_word(line.lower())]
+    for product_type in {r["product_type"] for r in records}:
+        phrases[("type", product_type)] = [_word(product_type.lower())]
+
+    # Each phrase names one concern or hair type; concerns claim it first
+    claimed: Set[str] = set()
+    named = [(concern, [concern]) for concern in CONCERN_KEYWORDS]
+    named += [(concern, [alias]) for alias, concern in CONCERN_ALIASES.items()]
+    named += list(CONCERN_KEYWORDS.items())
+    for concern, words in named:
+        words = [w for w in words if w not in claimed]
+        claimed.update(words)
+        phrases.setdefault(("concern", concern), []).extend(_word(w) for w in words)
+    for hair in HAIR_KEYWORDS:
+        if hair not in claimed:
+            phrases[("hair", hair)] = [_word(hair)]
+
+    return IntentMatcher({label: ps for label, ps in phrases.items() if ps}), lines
+
+
+# (engine, matcher, lines) for the most recently built matcher
+_matcher_cache: Tuple[Optional[Dict], Optional[IntentMatcher], Dict[str, List[Dict]]] = (None, None, {})
+
+
+def load_intent_matcher() -> Tuple[Optional[IntentMatcher], Dict[str, List[Dict]]]:
+    """Matcher for the current catalog, rebuilt along with the match engine."""
+    global _matcher_cache
+    engine = load_match_engine()
+    cached_engine, matcher, lines = _matcher_cache
+    if engine is not cached_engine:
+        matcher, lines = build_intent_matcher(engine["records"]) if engine is not None else (None, {})
+        _matcher_cache = (engine, matcher, lines)
+    return matcher, lines
+
+
+def _question_labels(q: str) -> Dict[str, List[str]]:
+    matcher, _ = load_intent_matcher()
+    found: Dict[str, List[str]] = {}
+    if matcher is not None:
+        for kind, value in matcher.labels(normalize_question(q)):
+            found.setdefault(kind, []).append(value)
+    else:
+        text = normalize_question(q)
+        for route, words in ROUTE_PHRASES.items():
+            if any(word in text for word in words):
+                found.setdefault("route", []).append(route)
+    return found
+
+
+def route_for(q: str) -> Optional[str]:
+    """"progress" or "analyze" when the question is about the user's own scans."""
+    routes = _question_labels(q).get("route", [])
+    return next((route for route in ROUTE_PHRASES if route in routes), None)
+
+
+# --------------------------------------------------------------------
+# ANSWER TEMPLATES
+# --------------------------------------------------------------------
+def _full_name(record: Dict) -> str:
+    return f"Gliss {record['product_name']} {record['product_type']}"
+
+
+def _join(items: List[str]) -> str:
+    items = list(dict.fromkeys(items))
+    if len(items) < 2:
+        return "".join(items)
+    return f"{', '.join(items[:-1])} and {items[-1]}"
+
+
+def _sentence(text: str) -> str:
+    text = str(text).strip().rstrip(".")
+    return text[:1].lower() + text[1:]
+
+
+def _size(size: str) -> str:
+    return re.sub(r"(?i)\s*ml$", " ml", str(size).strip())
+
+
+def answer_ingredients(line: str, products: List[Dict], record: Dict) -> str:
+    return f"Gliss {line} is made with {record['ingredients']}. Key benefit: {record['benefit']}."
+
+
+def answer_fragrance(line: str, products: List[Dict], record: Dict) -> str:
+    scent = re.sub(r"\s*fragrance$", "", str(record["fragrance"]).strip(), flags=re.I).lower()
+    return f"Gliss {line} has a {scent} scent."
+
+
+def answer_size(line: str, products: List[Dict], record: Dict) -> str:
+    sizes = {p["product_type"]: _size(p["size"]) for p in products}
+    return " ".join(f"Gliss {line} {kind} comes in {size}." for kind, size in sizes.items())
+
+
+def answer_usage(line: str, products: List[Dict], record: Dict) -> str:
+    steps = {p["product_type"]: _sentence(p["goal"]) for p in products}
+    kinds = list(steps)
+    if len(kinds) == 1:
+        return f"Use Gliss {line} {kinds[0]} to {steps[kinds[0]]}."
+    first, rest = kinds[0], kinds[1:]
+    return " ".join(
+        [f"Start with Gliss {line} {first} to {steps[first]}."]
+        + [f"Follow with Gliss {line} {kind} to {steps[kind]}." for kind in rest]
+    )
+
+
+def answer_about(line: str, products: List[Dict], record: Dict) -> str:
+    care = str(record["care_level"]).strip().lower()
+    care = care if "care" in care else f"{care} care"
+    hair = _join([str(p["hair_type"]).lower() for p in products])
+    concerns = _join([str(p["concern"]).lower() for p in products])
+    return (f"Gliss {line} is a {care} {str(record['need_state']).lower()} line made with {record['ingredients']}. "
+            f"It targets {concerns}. Suited hair types: {hair}.")
+
+
+def answer_recommend(subject: str, record: Dict) -> str:
+    return (f"For {subject}, I recommend {_full_name(record)}. It is made with {record['ingredients']} "
+            f"for {str(record['need_state']).lower()}. Key benefit: {record['benefit']}.")
+
+
+LINE_ANSWERS = {
+    "ingredients": answer_ingredients,
+    "fragrance": answer_fragrance,
+    "size": answer_size,
+    "usage": answer_usage,
+    "about": answer_about,
+}
+
+
+# --------------------------------------------------------------------
+# INSTANT ANSWERS
+# --------------------------------------------------------------------
+_stats = {"answered": 0, "deferred": 0}
+
+
+def instant_answer(q: str, hair_type: str, damage_score: float, concern: str) -> Optional[Tuple[str, Optional[Dict]]]:
+    """
+    Answer a catalog question without the model: (reply, product it is
+    about), or None when the question needs the model. Only unambiguous
+    questions are answered - one product line and one thing asked about
+    it, or a product recommendation for a named concern or product type.
+    """
+    found = _question_labels(q)
+    reply = _answer(found, hair_type, damage_score, concern)
+    _stats["answered" if reply is not None else "deferred"] += 1
+    return reply
+
+
+def _answer(found: Dict[str, List[str]], hair_type: str, damage_score: float, concern: str) -> Optional[Tuple[str, Optional[Dict]]]:
+    _, lines = load_intent_matcher()
+    intents = set(found.get("intent", []))
+    kinds = found.get("type", [])
+    mentioned = found.get("line", [])
+    if found.get("route") or len(mentioned) > 1 or len(kinds) > 1:
+        return None
+
+    asked = [intent for intent in LINE_INTENTS if intent in intents]
+    if len(asked) > 1:
+        return None
+    intent = asked[0] if asked else ("about" if "about" in intents and mentioned else None)
+
+    if intent is not None:
+        profile = get_matching_product(hair_type, concern, damage_score)
+        if mentioned:
+            line = mentioned[0]
+        elif profile is not None and intent != "about":
+            # "what's in it": the product Maya recommends for this profile
+            line = profile["product_name"]
+        else:
+            return None
+        products = [p for p in lines[line] if not kinds or p["product_type"] == kinds[0]]
+        if not products:
+            return None
+        record = _pick(products, profile)
+        return LINE_ANSWERS[intent](line, products, record), dict(record)
+
+    if "recommend" in intents and not mentioned and (kinds or found.get("concern") or found.get("hair")):
+        concerns = found.get("concern", [])
+        hairs = found.get("hair", [])
+        if len(concerns) > 1 or len(hairs) > 1:
+            return None
+        record = get_matching_product(hairs[0] if hairs else hair_type, concerns[0] if concerns else concern, damage_score)
+        if record is None:
+            return None
+        if kinds and record["product_type"] != kinds[0]:
+            same_line = [p for p in lines.get(record["product_name"], []) if p["product_type"] == kinds[0]]
+            if not same_line:
+                return None
+            record = _pick(same_line, record)
+        subject = _join([*concerns, *(f"{h} hair" for h in hairs)]) or f"your {kinds[0].lower()}"
+        return answer_recommend(subject, record), dict(record)
+
+    return None
+
+
+def _pick(products: List[Dict], preferred: Optional[Dict]) -> Dict:
+    """`preferred` itself, else its sibling for the same hair type, else the first product."""
+    if preferred is not None:
+        same_row = [p for p in products
+                    if p["product_name"] == preferred["product_name"] and p["hair_type"] == preferred["hair_type"]]
+        for product in same_row:
+            if product["product_type"] == preferred["product_type"]:
+                return product
+        if same_row:
+            return same_row[0]
+    return products[0]
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats)
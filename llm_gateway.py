@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Mapping, Optional
+
+from ollama import AsyncClient
+
+from cache import SingleFlight
+
+# --------------------------------------------------------------------
+# CONFIG
+# --------------------------------------------------------------------
+LLM_HOST: Optional[str] = None     # None: ollama's default / $OLLAMA_HOST
+LLM_MAX_IN_FLIGHT = 2              # generations running on the model server at once
+LLM_QUEUE_TIMEOUT = 10.0           # seconds to wait for a slot before GatewayBusy
+LLM_TIMEOUT = 60.0                 # seconds per call (per part when streaming)
+LLM_BREAKER_FAILURES = 5           # consecutive failures that open the circuit
+LLM_BREAKER_RESET = 30.0           # seconds before a trial call is let through
+
+
+class LLMUnavailable(RuntimeError):
+    """The model server cannot take this call; answer without it."""
+
+
+class GatewayBusy(LLMUnavailable):
+    """No generation slot freed up within LLM_QUEUE_TIMEOUT."""
+
+
+class CircuitOpen(LLMUnavailable):
+    """Recent calls kept failing; calls are rejected until the reset period passes."""
+
+
+class LLMTimeout(LLMUnavailable):
+    """The model server did not answer within LLM_TIMEOUT."""
+
+
+# --------------------------------------------------------------------
+# CIRCUIT BREAKER
+# --------------------------------------------------------------------
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed calls and rejects calls for
+    `reset_after` seconds. Then one trial call is let through (half-open):
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failures: int, reset_after: float):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def abandon(self) -> None:
+        """A let-through call ended without an outcome (e.g. cancelled)."""
+        self._trial = False
+
+    def record_success(self) -> None:
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self._consecutive += 1
+        self._trial = False
+        if self._opened_at is not None or self._consecutive >= self.failures:
+            self._opened_at = time.monotonic()
+
+
+# --------------------------------------------------------------------
+# GATEWAY
+# --------------------------------------------------------------------
+class LLMGateway:
+    """
+    Single entry point to the Ollama server for the asyncio app:
+    - at most `max_in_flight` generations run at once; callers wait up to
+      `queue_timeout` for a slot, then get GatewayBusy
+    - every call (every streamed part) is bounded by `timeout`
+    - identical in-flight non-streaming requests share one generation
+    - a circuit breaker fails fast while the server keeps failing
+    Point `host` at a stub server to exercise it without a model.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = LLM_HOST,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        timeout: float = LLM_TIMEOUT,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.client = AsyncClient(host=host)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET)
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._flights = SingleFlight()
+        self.calls = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.rejected = 0
+        # Token accounting from the model server, for measuring prompt cost
+        self.usage = {"responses": 0, "prompt_tokens": 0, "eval_tokens": 0, "prompt_ms": 0.0, "eval_ms": 0.0}
+        self.last_usage: Optional[Dict[str, Any]] = None
+
+    async def preload(self, model: str, keep_alive: Any = None) -> None:
+        """Load `model` into memory (an empty chat) so the first real call skips the load."""
+        await asyncio.wait_for(
+            self.client.chat(model=model, messages=[], keep_alive=keep_alive), self.timeout
+        )
+
+    async def chat(self, model: str, messages: list, **kwargs) -> Mapping[str, Any]:
+        """Complete a chat; concurrent identical requests share the result."""
+        key = hashlib.blake2b(
+            json.dumps([model, messages, kwargs], sort_keys=True, default=str).encode("utf-8"),
+            digest_size=16,
+        ).hexdigest()
+        if self._flights.get(key) is not None:
+            self.coalesced += 1
+        return await self._flights.run(key, lambda: self._chat(model, messages, **kwargs))
+
+    async def chat_stream(self, model: str, messages: list, **kwargs) -> AsyncIterator[Mapping[str, Any]]:
+        """Stream chat parts; the slot is held until the stream ends."""
+        await self._acquire()
+        stream = None
+        try:
+            try:
+                stream = await asyncio.wait_for(
+                    self.client.chat(model=model, messages=messages, stream=True, **kwargs), self.timeout
+                )
+                while True:
+                    try:
+                        part = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    if part.get("done"):
+                        self._record_usage(part)
+                    yield part
+            except asyncio.TimeoutError:
+                self._failed()
+                raise LLMTimeout(f"no response from model within {self.timeout:.0f}s")
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.abandon()
+                raise
+            except Exception:
+                self._failed()
+                raise
+            self.breaker.record_success()
+        finally:
+            self._slots.release()
+            if stream is not None:
+                # Stop the generation on the server if the client went away
+                await stream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "usage": self._usage_summary(),
+            "last_usage": self.last_usage,
+        }
+
+    async def _chat(self, model: str, messages: list, **kwargs) -> Mapping[str, Any]:
+        await self._acquire()
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat(model=model, messages=messages, **kwargs), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self._failed()
+            raise LLMTimeout(f"no response from model within {self.timeout:.0f}s")
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except Exception:
+            self._failed()
+            raise
+        finally:
+            self._slots.release()
+        self.breaker.record_success()
+        self._record_usage(response)
+        return response
+
+    async def _acquire(self) -> None:
+        """
+        Take a generation slot, then ask the breaker; raises without holding a
+        slot. An open circuit is rejected before waiting for a slot, so
+        callers fail fast instead of queueing for up to queue_timeout.
+        """
+        if self.breaker.state == "open":
+            self.rejected += 1
+            raise CircuitOpen("model server is failing, try again shortly")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise GatewayBusy("all model slots are busy")
+        if not self.breaker.allow():
+            self._slots.release()
+            self.rejected += 1
+            raise CircuitOpen("model server is failing, try again shortly")
+        self.calls += 1
+
+    def _record_usage(self, response: Mapping[str, Any]) -> None:
+        """Prompt/eval token counts and durations (ns) reported by the model server."""
+        usage = {
+            "prompt_tokens": response.get("prompt_eval_count") or 0,
+            "eval_tokens": response.get("eval_count") or 0,
+            "prompt_ms": (response.get("prompt_eval_duration") or 0) / 1e6,
+            "eval_ms": (response.get("eval_duration") or 0) / 1e6,
+            "load_ms": (response.get("load_duration") or 0) / 1e6,
+        }
+        self.last_usage = usage
+        self.usage["responses"] += 1
+        for name in ("prompt_tokens", "eval_tokens", "prompt_ms", "eval_ms"):
+            self.usage[name] += usage[name]
+        print(f"🧮 LLM usage: {usage['prompt_tokens']} prompt tokens in {usage['prompt_ms']:.0f} ms, "
+              f"{usage['eval_tokens']} eval tokens in {usage['eval_ms']:.0f} ms")
+
+    def _usage_summary(self) -> Dict[str, Any]:
+        n = self.usage["responses"]
+        return {
+            **self.usage,
+            "avg_prompt_tokens": round(self.usage["prompt_tokens"] / n, 1) if n else 0,
+            "avg_prompt_ms": round(self.usage["prompt_ms"] / n, 1) if n else 0,
+        }
+
+    def _failed(self) -> None:
+        self.failures += 1
+        self.breaker.record_failure()
@@ -1,132 +1,212 @@
-from ollama import Client
-from analyzer import get_all_products
+from analyzer import get_catalog, dataset_version
+from cache import LRUCache
+from llm_gateway import LLMGateway
+from sanitizer import sanitize, StreamSanitizer
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 import re
 
-client = Client()
+MAYA_MODEL = "mistral"
+MAYA_KEEP_ALIVE = "30m"  # how long the model server keeps the model loaded after a call
 
-def clean_text(text: str) -> str:
+# Identical for every request, so the model server can reuse its cached
+# prefix; everything per-request goes in the user message after it
+SYSTEM_PROMPT = """You are Maya, a professional hair stylist for Gliss by Henkel.
+
+CRITICAL RULES - FOLLOW EXACTLY:
+1. Write in PLAIN TEXT ONLY - absolutely NO emojis, NO special characters, NO symbols
+2. Keep response to 3-4 sentences maximum
+3. ALWAYS mention the exact Gliss product name given in the user's message
+4. Be warm, helpful, and natural like a professional stylist giving advice
+5. End with one practical tip
+6. NO bullet points, NO markdown, NO formatting - just clean sentences
+
+Remember: Plain text only. No emojis. No special characters. Professional and friendly tone."""
+
+# Cleaned replies keyed by the normalized question and the profile the
+# prompt is built from (hair type, concern, care-level bucket, product)
+REPLY_CACHE_BYTES = 2 * 1024 * 1024
+REPLY_CACHE_TTL = 6 * 3600  # seconds
+
+gateway = LLMGateway()
+reply_cache = LRUCache(REPLY_CACHE_BYTES, ttl=REPLY_CACHE_TTL)
+
+_QUESTION_NOISE = re.compile(r"[^\w\s]+")
+
+
+# --------------------------------------------------------------------
+# PRODUCT MATCHING
+# --------------------------------------------------------------------
+# Dataset keywords each user-facing hair type / concern expands to
+HAIR_KEYWORDS = {
+    'dry': ['dry', 'damaged', 'brittle'],
+    'damaged': ['damaged', 'dry', 'heavily damaged', 'strawy'],
+    'oily': ['greasy', 'oily'],
+    'normal': ['normal', 'fine'],
+    'fine': ['fine', 'normal', 'long hair'],
+    'thick': ['coarse', 'thick'],
+    'coarse': ['coarse', 'thick'],
+    'colored': ['colored', 'bleached'],
+    'curly': ['coarse', 'dry'],
+    'straight': ['fine', 'normal']
+}
+
+CONCERN_KEYWORDS = {
+    'dryness': ['dryness', 'dry', 'dehydration', 'moisture'],
+    'damage': ['damage', 'damaged', 'breakage', 'repair'],
+    'breakage': ['breakage', 'split ends', 'weakness'],
+    'frizz': ['lack of smoothness', 'dullness'],
+    'shine': ['dullness', 'lack of shine'],
+    'split ends': ['split ends', 'breakage'],
+    'greasiness': ['greasy roots', 'oily'],
+    'volume': ['weighing down', 'lack of fluidity']
+}
+
+# Points per keyword hit, per dataset column
+HAIR_TYPE_WEIGHT = 3
+PRIMARY_CONCERN_WEIGHT = 5
+SECONDARY_CONCERN_WEIGHT = 2
+CARE_LEVEL_WEIGHT = 4
+CONDITIONER_BONUS = 1
+
+# (catalog version, engine) for the most recently built engine
+_engine_cache: Tuple[int, Optional[Dict]] = (0, None)
+
+
+def _care_level_for(damage_score: float) -> str:
+    """Map damage score to care level (1-3 scale in dataset)."""
+    if damage_score >= 7:
+        return "Deep Care"
+    if damage_score >= 4:
+        return "Medium"
+    return "Gentle"
+
+
+def build_match_engine(df: pd.DataFrame) -> Dict:
     """
-    Remove ALL emojis, special characters, and markdown formatting.
-    Returns clean, plain text only.
+    Precompile the dataset into a keyword x product incidence matrix per
+    searched column, so scoring a profile is a small dot product that
+    never touches (or mutates) the shared DataFrame.
     """
-    # Remove emojis (comprehensive Unicode ranges)
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map symbols
-        "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        "\U00002702-\U000027B0"  # dingbats
-        "\U000024C2-\U0001F251"  # enclosed characters
-        "\U0001F900-\U0001F9FF"  # supplemental symbols
-        "\U0001FA70-\U0001FAFF"  # symbols and pictographs extended
-        "]+",
-        flags=re.UNICODE
-    )
-    text = emoji_pattern.sub('', text)
-    
-    # Remove markdown formatting
-    text = text.replace('**', '').replace('*', '').replace('_', '').replace('`', '')
-    
-    # Remove special bullets and symbols
-    text = text.replace('•', '-').replace('◦', '-').replace('▪', '-')
-    text = text.replace('→', '->').replace('←', '<-')
-    
-    # Clean up extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
+    columns = {
+        name: [str(v).lower() if pd.notna(v) else "" for v in df[name]]
+        for name in ('Hair Type', 'Primary Concern', 'Secondary Concern')
+    }
+    keywords = sorted({
+        kw for table in (HAIR_KEYWORDS, CONCERN_KEYWORDS) for kws in table.values() for kw in kws
+    })
 
+    def incidence(column: List[str]) -> np.ndarray:
+        return np.array([[kw in value for value in column] for kw in keywords], dtype=np.int32)
 
-def get_matching_product(hair_type: str, concern: str, damage_score: float):
+    base = CONDITIONER_BONUS * (df['Product Type'] == 'Conditioner').to_numpy(dtype=np.int32)
+    records = [
+        {
+            "product_name": row["Product"],
+            "product_type": row["Product Type"],
+            "care_level": row["Care Level"],
+            "ingredients": row["Key Ingredients"],
+            "benefit": row["Benefit from Ingredient"],
+            "texture": row["Hair Texture"],
+            "need_state": row["Need State"],
+            "hair_type": row["Hair Type"],
+            "concern": row["Primary Concern"],
+            "goal": row["Goal"],
+            "fragrance": row["Fragrance"],
+            "size": row["Size"],
+        }
+        for _, row in df.iterrows()
+    ]
+
+    return {
+        "vocab": {kw: i for i, kw in enumerate(keywords)},
+        "columns": columns,
+        "hair": incidence(columns['Hair Type']),
+        "primary": incidence(columns['Primary Concern']),
+        "secondary": incidence(columns['Secondary Concern']),
+        "care_levels": df['Care Level'].to_numpy(dtype=object),
+        "base": base,
+        "records": records,
+    }
+
+
+def load_match_engine() -> Optional[Dict]:
+    """Return the match engine for the current catalog, rebuilding it after a reload."""
+    global _engine_cache
+    version, df = get_catalog()
+    cached_version, engine = _engine_cache
+    if cached_version != version:
+        engine = build_match_engine(df) if df is not None and not df.empty else None
+        _engine_cache = (version, engine)
+    return engine
+
+
+def _keyword_hits(engine: Dict, matrix: str, column: str, keywords: List[str]) -> np.ndarray:
+    """Sum of incidence rows for `keywords`; unknown keywords are scanned directly."""
+    vocab = engine["vocab"]
+    counts = np.zeros(len(vocab), dtype=np.int32)
+    hits = np.zeros(len(engine["records"]), dtype=np.int32)
+    for kw in keywords:
+        if kw in vocab:
+            counts[vocab[kw]] += 1
+        else:
+            hits += [kw in value for value in engine["columns"][column]]
+    return counts @ engine[matrix] + hits
+
+
+@lru_cache(maxsize=1024)
+def _best_match(hair_type: str, concern: str, care_level: str, version: int) -> Optional[Dict]:
     """
-    Smart product matching based on hair type, concern, and damage level.
-    Returns best matching Gliss product from the dataset.
+    Score every product for a normalized profile; memoized per profile.
+    `version` is the catalog version, so a reload never serves stale matches.
     """
-    df = get_all_products()
-    if df is None or df.empty:
+    engine = load_match_engine()
+    if engine is None:
         return None
 
-    # Normalize inputs
-    hair_type = hair_type.lower().strip()
-    concern = concern.lower().strip()
-    
-    # Map damage score to care level (1-3 scale in dataset)
-    if damage_score >= 7:
-        care_level = "Deep Care"
-    elif damage_score >= 4:
-        care_level = "Medium"
+    concern_kws = CONCERN_KEYWORDS.get(concern, [concern])
+    scores = (
+        HAIR_TYPE_WEIGHT * _keyword_hits(engine, "hair", "Hair Type", HAIR_KEYWORDS.get(hair_type, [hair_type]))
+        + PRIMARY_CONCERN_WEIGHT * _keyword_hits(engine, "primary", "Primary Concern", concern_kws)
+        + SECONDARY_CONCERN_WEIGHT * _keyword_hits(engine, "secondary", "Secondary Concern", concern_kws)
+        + CARE_LEVEL_WEIGHT * (engine["care_levels"] == care_level)
+        + engine["base"]
+    )
+
+    if scores.max() > 0:
+        # First row wins ties, as in catalog order
+        best = int(np.argmax(scores))
     else:
-        care_level = "Gentle"
-    
-    # Scoring system for best match
-    df['match_score'] = 0
-    
-    # Score 1: Hair Type matching (flexible)
-    hair_keywords = {
-        'dry': ['dry', 'damaged', 'brittle'],
-        'damaged': ['damaged', 'dry', 'heavily damaged', 'strawy'],
-        'oily': ['greasy', 'oily'],
-        'normal': ['normal', 'fine'],
-        'fine': ['fine', 'normal', 'long hair'],
-        'thick': ['coarse', 'thick'],
-        'coarse': ['coarse', 'thick'],
-        'colored': ['colored', 'bleached'],
-        'curly': ['coarse', 'dry'],
-        'straight': ['fine', 'normal']
-    }
-    
-    for keyword in hair_keywords.get(hair_type, [hair_type]):
-        df.loc[df['Hair Type'].str.contains(keyword, case=False, na=False), 'match_score'] += 3
-    
-    # Score 2: Primary Concern matching
-    concern_keywords = {
-        'dryness': ['dryness', 'dry', 'dehydration', 'moisture'],
-        'damage': ['damage', 'damaged', 'breakage', 'repair'],
-        'breakage': ['breakage', 'split ends', 'weakness'],
-        'frizz': ['lack of smoothness', 'dullness'],
-        'shine': ['dullness', 'lack of shine'],
-        'split ends': ['split ends', 'breakage'],
-        'greasiness': ['greasy roots', 'oily'],
-        'volume': ['weighing down', 'lack of fluidity']
-    }
-    
-    for keyword in concern_keywords.get(concern, [concern]):
-        df.loc[df['Primary Concern'].str.contains(keyword, case=False, na=False), 'match_score'] += 5
-        df.loc[df['Secondary Concern'].str.contains(keyword, case=False, na=False), 'match_score'] += 2
-    
-    # Score 3: Care Level matching
-    df.loc[df['Care Level'] == care_level, 'match_score'] += 4
-    
-    # Score 4: Prefer conditioners over shampoos for advice
-    df.loc[df['Product Type'] == 'Conditioner', 'match_score'] += 1
-    
-    # Get best match
-    best_matches = df[df['match_score'] > 0].sort_values('match_score', ascending=False)
-    
-    if len(best_matches) == 0:
         # Fallback to care level only
-        best_matches = df[df['Care Level'] == care_level]
-    
-    if len(best_matches) == 0:
-        return None
-    
-    product = best_matches.iloc[0]
-    return {
-        "product_name": product["Product"],
-        "product_type": product["Product Type"],
-        "care_level": product["Care Level"],
-        "ingredients": product["Key Ingredients"],
-        "benefit": product["Benefit from Ingredient"],
-        "texture": product["Hair Texture"],
-        "need_state": product["Need State"],
-        "match_score": product["match_score"]
-    }
+        same_level = np.flatnonzero(engine["care_levels"] == care_level)
+        if len(same_level) == 0:
+            return None
+        best = int(same_level[0])
 
+    return {**engine["records"][best], "match_score": int(scores[best])}
 
-def maya_chat(q: str, hair_type: str, damage_score: float, concern: str, tts: bool = False):
-    """Conversational AI stylist that references Gliss products by name."""
+
+def get_matching_product(hair_type: str, concern: str, damage_score: float):
+    """
+    Smart product matching based on hair type, concern, and damage level.
+    Returns best matching Gliss product from the dataset.
+    """
+    match = _best_match(
+        hair_type.lower().strip(),
+        concern.lower().strip(),
+        _care_level_for(damage_score),
+        dataset_version(),
+    )
+    return dict(match) if match is not None else None
+
+
+def build_messages(q: str, hair_type: str, damage_score: float, concern: str) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Maya's chat messages for a question, and the product they were built
+    around: the fixed SYSTEM_PROMPT followed by a small per-request message.
+    """
 
     product_info = get_matching_product(hair_type, concern, damage_score)
     
@@ -153,35 +233,99 @@ Purpose: Moisture
 
 YOU MUST mention this specific product by its full name in your response."""
 
-    system_prompt = f"""You are Maya, a professional hair stylist for Gliss by Henkel.
-
-CRITICAL RULES - FOLLOW EXACTLY:
-1. Write in PLAIN TEXT ONLY - absolutely NO emojis, NO special characters, NO symbols
-2. Keep response to 3-4 sentences maximum
-3. ALWAYS mention the exact Gliss product name provided below
-4. Be warm, helpful, and natural like a professional stylist giving advice
-5. End with one practical tip
-6. NO bullet points, NO markdown, NO formatting - just clean sentences
-
-USER PROFILE:
+    user_prompt = f"""USER PROFILE:
 - Hair Type: {hair_type}
 - Damage Level: {damage_score}/10
 - Main Concern: {concern}
 
 {product_context}
 
-USER QUESTION: {q}
+USER QUESTION: {q}"""
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+    return messages, product_info
 
-Remember: Plain text only. No emojis. No special characters. Professional and friendly tone."""
 
-    response = client.chat(
-        model="mistral",
-        messages=[{"role": "user", "content": system_prompt}]
+def normalize_question(q: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_QUESTION_NOISE.sub(" ", q.lower()).split())
+
+
+def reply_key(q: str, hair_type: str, damage_score: float, concern: str, product_info: Optional[dict]) -> Tuple:
+    """Cache key for a reply: everything the answer depends on, bucketed."""
+    product = (product_info["product_name"], product_info["product_type"]) if product_info else None
+    return (
+        normalize_question(q),
+        hair_type.lower().strip(),
+        concern.lower().strip(),
+        _care_level_for(damage_score),
+        product,
+    )
+
+
+async def warm_model() -> None:
+    """Load Maya's model on the model server ahead of the first question."""
+    try:
+        await gateway.preload(MAYA_MODEL, keep_alive=MAYA_KEEP_ALIVE)
+        print(f"✓ Model {MAYA_MODEL} loaded (keep-alive {MAYA_KEEP_ALIVE})")
+    except Exception as e:
+        print(f"⚠️ Could not preload {MAYA_MODEL}: {e}")
+
+
+async def maya_chat(q: str, hair_type: str, damage_score: float, concern: str, tts: bool = False):
+    """Conversational AI stylist that references Gliss products by name."""
+
+    messages, product_info = build_messages(q, hair_type, damage_score, concern)
+    key = reply_key(q, hair_type, damage_score, concern, product_info)
+    cached = reply_cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = await gateway.chat(
+        model=MAYA_MODEL,
+        messages=messages,
+        keep_alive=MAYA_KEEP_ALIVE,
     )
     
     reply = response["message"]["content"]
     
     # Clean the response thoroughly
-    reply = clean_text(reply)
+    reply = sanitize(reply)
     
-    return reply
\ No newline at end of file
+    if reply:
+        reply_cache.put(key, reply)
+    return reply
+
+
+async def maya_chat_stream(q: str, hair_type: str, damage_score: float, concern: str) -> AsyncIterator[str]:
+    """
+    Stream Maya's reply as cleaned text deltas while the model generates it.
+    Joined, the deltas equal maya_chat's cleaned reply. A cached reply is
+    sent as a single delta; a fully streamed one is cached.
+    """
+    messages, product_info = build_messages(q, hair_type, damage_score, concern)
+    key = reply_key(q, hair_type, damage_score, concern, product_info)
+    cached = reply_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    cleaner = StreamSanitizer()
+    reply = []
+
+    stream = gateway.chat_stream(
+        model=MAYA_MODEL,
+        messages=messages,
+        keep_alive=MAYA_KEEP_ALIVE,
+    )
+    async for part in stream:
+        delta = cleaner.feed(part["message"]["content"])
+        if delta:
+            reply.append(delta)
+            yield delta
+
+    if reply:
+        reply_cache.put(key, "".join(reply))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class ScanResult(BaseModel):
@@ -33,4 +33,19 @@ class SaveResponse(BaseModel):
     """Schema for save confirmation response."""
     status: str
     message: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BatchImageResult(BaseModel):
+    """Outcome for one image of an /analyze_batch request."""
+    filename: Optional[str] = None
+    result: Optional[ScanResult] = None
+    error: Optional[str] = None
+
+
+class BatchScanResult(BaseModel):
+    """Schema for /analyze_batch - per-image results plus an aggregated verdict."""
+    results: List[BatchImageResult]
+    aggregate: Optional[ScanResult] = None
+    analyzed: int
+    failed: int
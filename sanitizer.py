@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+# --------------------------------------------------------------------
+# CHARACTER TABLE
+# --------------------------------------------------------------------
+# Code point ranges removed outright (emoji and pictographs)
+EMOJI_RANGES: List[Tuple[int, int]] = [
+    (0x1F600, 0x1F64F),  # emoticons
+    (0x1F300, 0x1F5FF),  # symbols & pictographs
+    (0x1F680, 0x1F6FF),  # transport & map
+    (0x1F1E0, 0x1F1FF),  # flags
+    (0x02702, 0x027B0),  # dingbats
+    (0x024C2, 0x1F251),  # enclosed characters
+    (0x1F900, 0x1F9FF),  # supplemental symbols
+    (0x1FA70, 0x1FAFF),  # symbols and pictographs extended
+    (0x0200D, 0x0200D),  # zero-width joiner inside emoji sequences
+    (0x020E3, 0x020E3),  # combining keycap
+]
+
+# Markdown markers and symbols, applied after emoji removal (so symbols
+# inside an emoji range, like ◦ and ▪, are removed rather than replaced)
+REPLACEMENTS: Dict[str, Optional[str]] = {
+    '*': None,
+    '_': None,
+    '`': None,
+    '•': '-',
+    '◦': '-',
+    '▪': '-',
+    '→': '->',
+    '←': '<-',
+}
+
+
+def _build_table() -> List[Union[int, str, None]]:
+    """
+    One str.translate table for every per-character rule: a list indexed
+    by code point (None deletes). Code points past its end are kept.
+    """
+    table: List[Union[int, str, None]] = list(range(max(hi for _, hi in EMOJI_RANGES) + 1))
+    for lo, hi in EMOJI_RANGES:
+        table[lo:hi + 1] = [None] * (hi - lo + 1)
+    for char, replacement in REPLACEMENTS.items():
+        if table[ord(char)] is not None:
+            table[ord(char)] = replacement
+    return table
+
+
+_TABLE = _build_table()
+
+
+# --------------------------------------------------------------------
+# SANITIZING
+# --------------------------------------------------------------------
+def sanitize(text: str) -> str:
+    """
+    Remove ALL emojis, special characters, and markdown formatting, and
+    collapse whitespace. Returns clean, plain text only.
+    """
+    return " ".join(text.translate(_TABLE).split())
+
+
+class StreamSanitizer:
+    """
+    sanitize() for a stream of chunks: the joined output of feed() equals
+    sanitize() of the joined input, wherever the chunks were cut.
+
+    Every character rule is context-free - each code point of a
+    multi-codepoint emoji is removed on its own, and `**` is two removed
+    `*` - so a chunk boundary can never split a match. Only whitespace
+    needs state: a separating space is emitted once the next word
+    arrives, and never at the start.
+    """
+
+    def __init__(self):
+        self._space = False
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        text = chunk.translate(_TABLE)
+        words = text.split()
+        if not words:
+            self._space = self._space or bool(text)
+            return ""
+        lead = " " if self._started and (self._space or text[0].isspace()) else ""
+        self._space = text[-1].isspace()
+        self._started = True
+        return lead + " ".join(words)
@@ -0,0 +1,100 @@
+from typing import Any, Dict, Optional
+
+Record = Dict[str, Any]
+
+
+class ScanAggregates:
+    """
+    Running aggregates over scan history, updated in O(1) per record:
+    count/sum/min/max of scores, first and latest scans (by insertion and by
+    timestamp) and the most common product and texture.
+    """
+
+    FIELDS = (
+        "count", "scored", "score_sum", "score_min", "score_max",
+        "first_score", "last_score", "first", "last", "earliest", "latest",
+        "products", "textures", "top_product", "top_texture",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.scored = 0
+        self.score_sum = 0.0
+        self.score_min: Optional[float] = None
+        self.score_max: Optional[float] = None
+        self.first_score: Optional[float] = None
+        self.last_score: Optional[float] = None
+        self.first: Optional[Record] = None      # insertion order
+        self.last: Optional[Record] = None
+        self.earliest: Optional[Record] = None   # timestamp order
+        self.latest: Optional[Record] = None
+        self.products: Dict[str, int] = {}
+        self.textures: Dict[str, int] = {}
+        self.top_product: Optional[str] = None
+        self.top_texture: Optional[str] = None
+
+    # ------------------------------
+    # ➕ UPDATE
+    # ------------------------------
+    def add(self, record: Record) -> None:
+        self.count += 1
+        if self.first is None:
+            self.first = record
+        self.last = record
+
+        score = record.get("damage_score")
+        if score is not None:
+            self.scored += 1
+            self.score_sum += score
+            self.score_min = score if self.score_min is None else min(self.score_min, score)
+            self.score_max = score if self.score_max is None else max(self.score_max, score)
+            if self.first_score is None:
+                self.first_score = score
+            self.last_score = score
+
+        timestamp = record.get("timestamp")
+        if timestamp is not None:
+            # Ties keep the same picks as a stable sort by timestamp
+            if self.earliest is None or timestamp < self.earliest["timestamp"]:
+                self.earliest = record
+            if self.latest is None or timestamp >= self.latest["timestamp"]:
+                self.latest = record
+
+        if "recommended_product" in record:
+            self.top_product = self._count(self.products, record["recommended_product"], self.top_product)
+        if "detected_texture" in record:
+            self.top_texture = self._count(self.textures, record["detected_texture"], self.top_texture)
+
+    @staticmethod
+    def _count(counts: Dict[str, int], key: str, top: Optional[str]) -> str:
+        counts[key] = counts.get(key, 0) + 1
+        if top is None or counts[key] > counts[top]:
+            return key
+        return top
+
+    def copy(self) -> "ScanAggregates":
+        """Independent copy, so updates can be built without disturbing readers."""
+        clone = ScanAggregates.from_dict(self.to_dict())
+        clone.products = dict(self.products)
+        clone.textures = dict(self.textures)
+        return clone
+
+    # ------------------------------
+    # 📐 DERIVED VALUES
+    # ------------------------------
+    @property
+    def avg(self) -> float:
+        return self.score_sum / self.scored if self.scored else 0.0
+
+    # ------------------------------
+    # 💾 PERSISTENCE
+    # ------------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScanAggregates":
+        aggregates = cls()
+        for name in cls.FIELDS:
+            setattr(aggregates, name, data[name])
+        return aggregates
@@ -0,0 +1,370 @@
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+Record = Dict[str, Any]
+
+# Records appended (by this process) between routine compactions
+COMPACT_EVERY = 1000
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock on `path` shared by every process using it."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# ------------------------------
+# 🗄️ BASE STORE
+# ------------------------------
+class ScanStore:
+    """Storage backend for scan history: O(1) appends, ordered full reads."""
+
+    _since_compact = 0
+
+    def append(self, record: Record) -> None:
+        self.append_many([record])
+
+    def append_many(self, records: Iterable[Record]) -> None:
+        raise NotImplementedError
+
+    def load(self) -> List[Record]:
+        records, _, _ = self.read_since(None)
+        return records
+
+    def read_since(self, cursor: Optional[Hashable]) -> Tuple[List[Record], Hashable, bool]:
+        """
+        Read records appended after `cursor` (None reads everything).
+        Returns (records, new cursor, reset); reset=True means the storage was
+        rewritten and `records` is the full history rather than a delta.
+        """
+        raise NotImplementedError
+
+    def stamp(self) -> Hashable:
+        """Cheap token that changes whenever stored data changes (no parsing)."""
+        raise NotImplementedError
+
+    def compact(self) -> None:
+        """Rewrite storage without damaged entries and reclaim space. Optional."""
+
+    def _compaction_due(self, appended: int) -> bool:
+        """Count `appended` records; True once every COMPACT_EVERY of them."""
+        self._since_compact += appended
+        if self._since_compact < COMPACT_EVERY:
+            return False
+        self._since_compact = 0
+        return True
+
+    def is_empty(self) -> bool:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release open files or connections; the store reopens them if used again."""
+
+    def migrate_from(self, legacy_file: str) -> None:
+        """
+        Import a legacy `scan_history.json` list the first time the store is used.
+        The emptiness check and the import happen together under the store's
+        cross-process lock, so workers starting at once import it only once.
+        """
+        if not self.is_empty() or not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Could not migrate {legacy_file}: {e}")
+            return
+        if isinstance(data, list) and data and self.append_if_empty(data):
+            print(f"✅ Migrated {len(data)} scans from {legacy_file}")
+
+    def append_if_empty(self, records: List[Record]) -> bool:
+        """Atomically append `records` only if the store is empty; True if appended."""
+        raise NotImplementedError
+
+
+# ------------------------------
+# 📜 JSON-LINES LOG
+# ------------------------------
+class JsonlScanStore(ScanStore):
+    """
+    Append-only JSON-lines log: one scan per line, so a save writes one
+    line instead of rewriting the whole history. A torn last line (crash
+    mid-append) is skipped on read and removed by compaction, which runs
+    when a read finds one and every COMPACT_EVERY appends. Writers in
+    other processes are serialized through `<path>.lock`, and every batch
+    is fsynced before append_many returns.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+
+    def append_many(self, records: Iterable[Record]) -> None:
+        data = "".join(json.dumps(r) + "\n" for r in records)
+        if not data:
+            return
+        with self._lock, file_lock(self.lock_path):
+            self._write(data)
+            due = self._compaction_due(data.count("\n"))
+        if due:
+            self.compact()
+
+    def append_if_empty(self, records: List[Record]) -> bool:
+        with self._lock, file_lock(self.lock_path):
+            if not self.is_empty():
+                return False
+            self._write("".join(json.dumps(r) + "\n" for r in records))
+            return True
+
+    def read_since(self, cursor: Optional[Hashable]) -> Tuple[List[Record], Hashable, bool]:
+        """Cursor is (inode, byte offset of the first unread line)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return [], None, cursor is not None
+        reset = cursor is None or cursor[0] != st.st_ino or cursor[1] > st.st_size
+        offset = 0 if reset else cursor[1]
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+        # Only consume complete lines; a line still being written is read next time
+        end = chunk.rfind(b"\n") + 1
+        records, damaged = self._parse(chunk[:end].decode("utf-8", errors="replace").splitlines())
+        if damaged:
+            print(f"⚠️ Skipped {damaged} damaged line(s) in {self.path} - compacting")
+            self.compact()
+        return records, (st.st_ino, offset + end), reset
+
+    def stamp(self) -> Hashable:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def compact(self) -> None:
+        with self._lock, file_lock(self.lock_path):
+            records, _ = self._read()
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                f.writelines(json.dumps(r) + "\n" for r in records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    def is_empty(self) -> bool:
+        try:
+            return os.path.getsize(self.path) == 0
+        except OSError:
+            return True
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return self._parse(f)
+        except FileNotFoundError:
+            return [], 0
+
+    @staticmethod
+    def _parse(lines: Iterable[str]):
+        records, damaged = [], 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                damaged += 1
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+            else:
+                damaged += 1
+        return records, damaged
+
+    def _write(self, data: str) -> None:
+        """Append and fsync `data`; the caller holds both locks."""
+        self._heal_tail()
+        with open(self.path, "a") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _heal_tail(self) -> None:
+        """Terminate a torn last line so the next record starts on its own line."""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        except OSError:
+            return
+        if torn:
+            with open(self.path, "a") as f:
+                f.write("\n")
+
+
+# ------------------------------
+# 🛢️ SQLITE (WAL)
+# ------------------------------
+class SQLiteScanStore(ScanStore):
+    """
+    SQLite store in WAL mode: each append_many is one transaction, readers
+    never block the writer and SQLite's own locking covers other processes.
+    Threads share one connection, opened on first use and taken under the
+    store's lock, so an open store costs one set of file descriptors.
+    Every COMPACT_EVERY appends the WAL is checkpointed and truncated, so
+    it does not grow between restarts.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        with self._connect() as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scans ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " timestamp TEXT,"
+                " record TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS scans_timestamp ON scans (timestamp)")
+
+    @contextmanager
+    def _connect(self):
+        """The store's connection, held exclusively for the block."""
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                # Commits are batched by GroupCommit, so a sync per commit is cheap
+                conn.execute("PRAGMA synchronous=FULL")
+                self._conn = conn
+            yield self._conn
+
+    def append_many(self, records: Iterable[Record]) -> None:
+        rows = [(r.get("timestamp"), json.dumps(r)) for r in records]
+        if not rows:
+            return
+        with self._connect() as conn, conn:
+            conn.executemany("INSERT INTO scans (timestamp, record) VALUES (?, ?)", rows)
+        if self._compaction_due(len(rows)):
+            self.compact()
+
+    def append_if_empty(self, records: List[Record]) -> bool:
+        with self._connect() as conn:
+            # Take the write lock before looking, so no other writer can slip in between
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM scans LIMIT 1").fetchone() is not None:
+                    conn.rollback()
+                    return False
+                conn.executemany(
+                    "INSERT INTO scans (timestamp, record) VALUES (?, ?)",
+                    [(r.get("timestamp"), json.dumps(r)) for r in records],
+                )
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            return True
+
+    def read_since(self, cursor: Optional[Hashable]) -> Tuple[List[Record], Hashable, bool]:
+        """Cursor is the last row id read."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, record FROM scans WHERE id > ? ORDER BY id", (cursor or 0,)
+            ).fetchall()
+        last_id = rows[-1][0] if rows else cursor
+        return [json.loads(record) for _, record in rows], last_id, cursor is None
+
+    def stamp(self) -> Hashable:
+        # The newest committed row id. File mtimes/sizes are not a commit
+        # marker: WAL frames are written (and synced) before the commit is
+        # visible to readers, so a stamp taken from them can run ahead of
+        # what read_since sees. Rows are never deleted, so this only grows.
+        with self._connect() as conn:
+            return conn.execute("SELECT max(id) FROM scans").fetchone()[0]
+
+    def compact(self) -> None:
+        with self._connect() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def is_empty(self) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM scans LIMIT 1").fetchone() is None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ------------------------------
+# 🚚 GROUP COMMIT
+# ------------------------------
+class GroupCommit:
+    """
+    Single-writer queue in front of a store. Concurrent appends are queued;
+    whichever caller finds no write in progress becomes the writer and
+    commits everything queued so far as one append_many (one write, one
+    fsync), repeating until the queue is empty. Every caller returns once
+    its own record is durable, or raises the commit's error.
+    """
+
+    def __init__(self, store: ScanStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._queue: List[Tuple[Record, Future]] = []
+        self._writing = False
+
+    def append(self, record: Record) -> None:
+        done: Future = Future()
+        with self._lock:
+            self._queue.append((record, done))
+            lead = not self._writing
+            self._writing = True
+        if lead:
+            self._drain()
+        done.result()
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                batch, self._queue = self._queue, []
+                if not batch:
+                    self._writing = False
+                    return
+            try:
+                self.store.append_many([record for record, _ in batch])
+            except Exception as e:
+                for _, done in batch:
+                    done.set_exception(e)
+            else:
+                for _, done in batch:
+                    done.set_result(None)
+
+
+BACKENDS = {
+    "jsonl": JsonlScanStore,
+    "sqlite": SQLiteScanStore,
+}
@@ -1,22 +1,72 @@
-from fastapi import FastAPI, UploadFile, File, Request
+from fastapi import FastAPI, UploadFile, File, Request, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from PIL import Image
-import io
 from datetime import datetime
-import pyttsx3
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import threading
 import os
-import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Import your modules
-from analyzer import analyze_hair_balanced
+from analyzer import (
+    analyze_image_bytes, aggregate_results, load_recommendation_index,
+    on_dataset_reload, watch_dataset,
+)
+import intents
 import tracker
-from models import ScanResult, SaveResponse
-from maya_chat import maya_chat, get_matching_product
+import tts
+from models import ScanResult, SaveResponse, BatchScanResult
+from maya_chat import maya_chat, maya_chat_stream, get_matching_product, load_match_engine, warm_model
+from maya_chat import gateway as maya_gateway, reply_cache as maya_reply_cache
+from cache import LRUCache, SingleFlight
+from sanitizer import sanitize
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
 
 # Initialize FastAPI app
-app = FastAPI(title="Gliss Mirror API", version="1.1")
+app = FastAPI(title="Gliss Mirror API", version="1.1", default_response_class=FastJSONResponse)
+
+# Image analysis runs on a worker pool; beyond the queue depth, requests are
+# rejected with 503 rather than waiting. MAX_BATCH_IMAGES caps /analyze_batch.
+ANALYSIS_WORKERS = os.cpu_count() or 2
+ANALYSIS_QUEUE_DEPTH = 16
+ANALYSIS_RETRY_AFTER = 2  # seconds
+MAX_BATCH_IMAGES = 8
+
+# Analysis results are cached by upload hash (bounded by bytes, with TTL)
+ANALYSIS_CACHE_BYTES = 4 * 1024 * 1024
+ANALYSIS_CACHE_TTL = 3600  # seconds
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_analysis_in_flight = 0
+analysis_cache = LRUCache(ANALYSIS_CACHE_BYTES, ttl=ANALYSIS_CACHE_TTL)
+analysis_flights = SingleFlight()
+_dataset_watch_stop = threading.Event()
+
+TTS_RETRY_AFTER = 2  # seconds
+
+# Responses larger than this are gzip-compressed for clients that accept it
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
 
 # CORS Configuration
 app.add_middleware(
@@ -25,32 +75,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
-
-# ==================== EMOJI CLEANING FUNCTION ====================
-
-def clean_maya_response(text: str) -> str:
-    """Remove ALL emojis, special characters, and markdown formatting."""
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map
-        "\U0001F1E0-\U0001F1FF"  # flags
-        "\U00002702-\U000027B0"  # dingbats
-        "\U000024C2-\U0001F251"  # enclosed
-        "\U0001F900-\U0001F9FF"  # supplemental
-        "\U0001FA70-\U0001FAFF"  # extended
-        "]+",
-        flags=re.UNICODE
-    )
-    text = emoji_pattern.sub('', text)
-    text = text.replace('**', '').replace('*', '').replace('_', '').replace('`', '')
-    text = text.replace('•', '-').replace('◦', '-').replace('▪', '-')
-    text = text.replace('→', '->').replace('←', '<-')
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=COMPRESS_LEVEL)
 
 # ==================== MODELS ====================
 
@@ -63,6 +90,9 @@ class MayaChatRequest(BaseModel):
 
 class TTSRequest(BaseModel):
     text: str
+    voice: Optional[str] = None
+    rate: Optional[int] = None
+    stream: bool = False  # stream sentence by sentence with chunked transfer
 
 
 # ==================== HEALTH CHECK ====================
@@ -74,25 +104,214 @@ def home():
         "status": "running",
         "message": "Gliss Mirror API is live",
         "version": "1.1",
-        "timestamp": datetime.utcnow()
+        "timestamp": datetime.utcnow(),
+        "caches": {
+            "analysis": analysis_cache.stats(),
+            "maya_replies": maya_reply_cache.stats(),
+        },
+        "llm": maya_gateway.stats(),
+        "instant_answers": intents.stats(),
     }
 
 
 # ==================== HAIR ANALYSIS ====================
 
+def start_process_pool() -> ProcessPoolExecutor:
+    """
+    Start the analysis worker pool now (spawned, so no event-loop state is
+    forked) and have every worker load the catalog, so no request waits for it.
+    """
+    global _process_pool
+    _process_pool = ProcessPoolExecutor(
+        max_workers=ANALYSIS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=load_recommendation_index,
+    )
+
+    def report(future) -> None:
+        if future.exception() is not None:
+            print(f"⚠️ Analysis worker failed to start: {future.exception()!r}")
+
+    # Each submit finds no idle worker yet, so this spawns all of them
+    for _ in range(ANALYSIS_WORKERS):
+        _process_pool.submit(os.getpid).add_done_callback(report)
+    return _process_pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    if _process_pool is None:
+        start_process_pool()
+    return _process_pool
+
+
+def replace_process_pool(pool: ProcessPoolExecutor) -> None:
+    """Retire `pool` (running work finishes on it) and start a fresh one in its place."""
+    pool.shutdown(wait=False)
+    if _process_pool is pool:
+        start_process_pool()
+
+
+def _release_analysis_slot(_future) -> None:
+    global _analysis_in_flight
+    _analysis_in_flight -= 1
+
+
+def _store_analysis(key: str):
+    """Done-callback that caches a successful analysis under its upload hash."""
+    def store(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            analysis_cache.put(key, future.result())
+    return store
+
+
+async def _await_analysis(pending):
+    if isinstance(pending, asyncio.Future):
+        return dict(await asyncio.shield(pending))
+    return dict(pending)
+
+
+async def run_analysis(uploads: List[bytes]) -> List:
+    """
+    Analyze uploads on the worker pool, keeping the event loop free.
+
+    Results are cached by a hash of the upload bytes, and identical uploads
+    already being analyzed share that computation, so only new images
+    reach the pool.
+
+    Admission control: at most ANALYSIS_WORKERS + ANALYSIS_QUEUE_DEPTH images
+    may be running or queued at once. Beyond that the request is rejected
+    immediately with 503 + Retry-After instead of queueing without bound.
+    Returns one result or exception per upload, in order.
+    """
+    global _analysis_in_flight
+    keys = [hashlib.blake2b(data, digest_size=16).hexdigest() for data in uploads]
+
+    pending, new = {}, {}
+    for key, data in zip(keys, uploads):
+        if key in pending or key in new:
+            continue
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            pending[key] = cached
+        elif analysis_flights.get(key) is not None:
+            pending[key] = analysis_flights.get(key)
+        else:
+            new[key] = data
+
+    capacity = ANALYSIS_WORKERS + ANALYSIS_QUEUE_DEPTH
+    if new and _analysis_in_flight + len(new) > capacity:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, please retry shortly",
+            headers={"Retry-After": str(ANALYSIS_RETRY_AFTER)},
+        )
+
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool() if new else None
+    for key, data in new.items():
+        try:
+            future = pool.submit(analyze_image_bytes, data)
+        except BrokenProcessPool:
+            # A worker died between requests; the pool refuses new work
+            replace_process_pool(pool)
+            raise HTTPException(
+                status_code=503,
+                detail="Analysis workers are restarting, please retry shortly",
+                headers={"Retry-After": str(ANALYSIS_RETRY_AFTER)},
+            )
+        _analysis_in_flight += 1
+        # Slots are freed when the worker finishes, even if the client has gone
+        future.add_done_callback(
+            lambda f: loop.call_soon_threadsafe(_release_analysis_slot, f)
+        )
+        flight = analysis_flights.start(key, asyncio.wrap_future(future))
+        flight.add_done_callback(_store_analysis(key))
+        pending[key] = flight
+
+    outcomes = await asyncio.gather(
+        *(_await_analysis(pending[key]) for key in keys),
+        return_exceptions=True,
+    )
+
+    if any(isinstance(o, BrokenProcessPool) for o in outcomes) and pool is not None and _process_pool is pool:
+        # A worker died (e.g. OOM); replace the pool before the next request
+        replace_process_pool(pool)
+
+    return outcomes
+
+
 @app.post("/analyze", response_model=ScanResult)
 async def analyze_image(file: UploadFile = File(...)):
     """Analyze a hair image and return damage assessment + product recommendation."""
     image_data = await file.read()
-    image = Image.open(io.BytesIO(image_data))
-    result = analyze_hair_balanced(image)
+    (result,) = await run_analysis([image_data])
+    if isinstance(result, Exception):
+        raise result
     return result
 
 
+@app.post("/analyze_batch", response_model=BatchScanResult)
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    """Analyze several photos (roots, mid-lengths, ends) in parallel and aggregate the verdict."""
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many images: {len(files)} (max {MAX_BATCH_IMAGES})"
+        )
+
+    uploads = [await f.read() for f in files]
+    outcomes = await run_analysis(uploads)
+
+    results, analyzed = [], []
+    for upload, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"⚠️ Batch analysis failed for {upload.filename}: {outcome}")
+            results.append({"filename": upload.filename, "error": str(outcome)})
+        else:
+            results.append({"filename": upload.filename, "result": outcome})
+            analyzed.append(outcome)
+
+    return {
+        "results": results,
+        "aggregate": aggregate_results(analyzed),
+        "analyzed": len(analyzed),
+        "failed": len(results) - len(analyzed),
+    }
+
+
 # ==================== SCAN TRACKING ====================
 
+def current_user(user_id: Optional[str] = None, x_user_id: Optional[str] = Header(None)) -> str:
+    """History owner: the `user_id` query parameter or the X-User-Id header (device id)."""
+    try:
+        return tracker.validate_user_id(user_id or x_user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def conditional_json(request: Request, user: str, build) -> Response:
+    """
+    Serve `build()` with an ETag derived from the user's history revision
+    and the request URL. A matching If-None-Match gets an empty 304 and
+    `build` is never called. The tag is computed before the body, so a
+    save landing in between can only cost an extra 200, never a stale 304.
+    """
+    revision = tracker.history_revision(user)
+    digest = hashlib.blake2b(
+        f"{user}|{revision}|{request.url.path}?{request.url.query}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+    etag = f'W/"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "X-User-Id"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(build(), headers=headers)
+
+
 @app.post("/save_scan", response_model=SaveResponse)
-async def save_scan(request: Request):
+async def save_scan(request: Request, user: str = Depends(current_user)):
     """Save a scan result to progress history."""
     try:
         body = await request.json()
@@ -110,7 +329,9 @@ async def save_scan(request: Request):
         }
         
         print(f"💾 Saving normalized data: {normalized_data}")
-        tracker.save_scan(normalized_data)
+        # Off the event loop, so concurrent saves can share a group commit
+        if not await asyncio.to_thread(tracker.save_scan, normalized_data, user):
+            raise RuntimeError("scan could not be stored")
         
         return SaveResponse(
             status="success",
@@ -132,47 +353,80 @@ async def save_scan(request: Request):
 
 
 @app.get("/history")
-def get_history():
-    """Retrieve all saved scans from history."""
-    return tracker.load_history()
+def get_history(
+    request: Request,
+    user: str = Depends(current_user),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    order: Optional[str] = None,
+):
+    """
+    Retrieve saved scans from history.
+
+    Without parameters this is the full list. With any of limit, cursor,
+    since (ISO timestamp, exclusive), start/end (ISO, inclusive) or order
+    (asc/desc) it returns one timestamp-ordered page:
+    {"items", "next_cursor", "has_more", "version"}.
+    """
+    def build():
+        if all(p is None for p in (limit, cursor, since, start, end, order)):
+            return tracker.get_history(user)
+        if order not in (None, "asc", "desc"):
+            raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+        try:
+            return tracker.query_history(
+                user,
+                limit=limit or tracker.HISTORY_PAGE_SIZE,
+                cursor=cursor,
+                since=since,
+                start=start,
+                end=end,
+                descending=order == "desc",
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return conditional_json(request, user, build)
 
 
 @app.get("/stats")
-def get_stats():
+def get_stats(request: Request, user: str = Depends(current_user)):
     """Return overall statistics from scan history."""
-    return tracker.get_stats()
+    return conditional_json(request, user, lambda: tracker.get_stats(user))
 
 
 @app.get("/comparison")
-def get_comparison():
+def get_comparison(request: Request, user: str = Depends(current_user)):
     """Compare first vs latest scans to show progress."""
-    return tracker.get_comparison()
+    return conditional_json(request, user, lambda: tracker.get_comparison(user))
 
 
 # ==================== INSIGHTS & ANALYTICS ====================
 
 @app.get("/insights")
-def get_insights():
+def get_insights(request: Request, user: str = Depends(current_user)):
     """Analyze progress history and return AI-style improvement insights."""
-    history = tracker.load_history()
-    
-    if not history:
-        return {"message": "No scans available yet."}
+    return conditional_json(request, user, lambda: insights_view(tracker.get_aggregates(user)))
+
 
-    scores = [h["damage_score"] for h in history if "damage_score" in h]
-    products = [h["recommended_product"] for h in history if "recommended_product" in h]
-    textures = [h["detected_texture"] for h in history if "detected_texture" in h]
+def insights_view(agg) -> dict:
+    """Build the /insights payload from a user's ScanAggregates."""
+    if not agg.count:
+        return {"message": "No scans available yet."}
 
-    if not scores:
+    if not agg.scored:
         return {"message": "No valid scan data available."}
 
-    avg_score = sum(scores) / len(scores)
-    first_score, last_score = scores[0], scores[-1]
+    avg_score = agg.avg
+    first_score, last_score = agg.first_score, agg.last_score
     delta = round(first_score - last_score, 2)
     trend = "Improving" if last_score < first_score else "Worsening" if last_score > first_score else "Stable"
 
-    best_product = max(set(products), key=products.count) if products else "N/A"
-    common_texture = max(set(textures), key=textures.count) if textures else "N/A"
+    best_product = agg.top_product or "N/A"
+    common_texture = agg.top_texture or "N/A"
 
     if delta > 0:
         improvement_msg = f"Great progress! Your average score improved by {abs(delta)} points"
@@ -190,28 +444,53 @@ def get_insights():
         "most_used_product": best_product,
         "most_common_texture": common_texture,
         "insight": improvement_msg,
-        "total_scans": len(history)
+        "total_scans": agg.count
     }
 
 
+@app.get("/dashboard")
+def get_dashboard(request: Request, user: str = Depends(current_user), history_limit: Optional[int] = None):
+    """
+    Everything the main screen needs - history, stats, insights and Maya's
+    greeting - computed from one consistent history snapshot.
+    `history_limit` trims history to the newest N scans.
+    """
+    def build():
+        version, history, agg = tracker.history_view(user)
+        if history_limit is not None:
+            history = history[-history_limit:] if history_limit > 0 else ()
+        return {
+            "version": version,
+            "history": history,
+            "stats": tracker.stats_view(agg),
+            "insights": insights_view(agg),
+            "maya_greet": maya_greet_view(agg),
+        }
+
+    return conditional_json(request, user, build)
+
+
 # ==================== MAYA CHAT AI ====================
 
 @app.get("/maya_greet")
-def maya_greet_user():
+def maya_greet_user(user: str = Depends(current_user)):
     """Maya's personalized greeting based on user's latest scan."""
+    return maya_greet_view(tracker.get_aggregates(user))
+
+
+def maya_greet_view(agg) -> dict:
+    """Build Maya's greeting from a user's ScanAggregates."""
     try:
-        history = tracker.load_history()
-        
-        if not history:
+        if not agg.count:
             greeting = "Hi there! I'm Maya, your personal AI hair stylist. I'm here 24/7 to help you achieve your best hair ever! Let's start with your first hair analysis - just tap the camera icon to begin your journey!"
             return {
-                "maya_response": clean_maya_response(greeting),
+                "maya_response": sanitize(greeting),
                 "has_scan": False,
                 "first_time": True
             }
         
         # Get latest scan
-        latest = history[-1]
+        latest = agg.last
         score = latest.get("damage_score", 5.0)
         level = latest.get("level", "Unknown")
         product = latest.get("recommended_product", "Unknown")
@@ -219,8 +498,8 @@ def maya_greet_user():
         
         # Calculate trend
         delta = 0
-        if len(history) > 1:
-            first_score = history[0].get("damage_score", score)
+        if agg.count > 1:
+            first_score = agg.first.get("damage_score", score)
             delta = first_score - score
             
             if delta > 1:
@@ -243,12 +522,12 @@ def maya_greet_user():
             greeting = f"Hi there! {trend_msg}Your hair needs some extra love (score: {score:.1f}/10). Don't worry - I'm here to help! Focus on {concern} with {product}. Let's get your hair back to its best together!"
         
         return {
-            "maya_response": clean_maya_response(greeting),
+            "maya_response": sanitize(greeting),
             "has_scan": True,
             "latest_score": score,
             "level": level,
             "trend": delta,
-            "total_scans": len(history)
+            "total_scans": agg.count
         }
         
     except Exception as e:
@@ -256,24 +535,24 @@ def maya_greet_user():
         import traceback
         traceback.print_exc()
         return {
-            "maya_response": clean_maya_response("Hi! I'm Maya, ready to help you with your hair!"),
+            "maya_response": sanitize("Hi! I'm Maya, ready to help you with your hair!"),
             "has_scan": False
         }
 
 
 @app.get("/maya_analyze_scan")
-def maya_analyze_latest_scan():
+def maya_analyze_latest_scan(user: str = Depends(current_user)):
     """Maya provides detailed analysis and actionable advice on the latest scan."""
     try:
-        history = tracker.load_history()
+        agg = tracker.get_aggregates(user)
         
-        if not history:
+        if not agg.count:
             return {
-                "maya_response": clean_maya_response("You haven't scanned your hair yet! Let's do that first so I can give you personalized advice!"),
+                "maya_response": sanitize("You haven't scanned your hair yet! Let's do that first so I can give you personalized advice!"),
                 "has_scan": False
             }
         
-        latest = history[-1]
+        latest = agg.last
         score = latest.get("damage_score", 5.0)
         level = latest.get("level", "Unknown")
         texture = latest.get("detected_texture", "Unknown")
@@ -330,8 +609,8 @@ def maya_analyze_latest_scan():
             analysis_parts.append("- Stay hydrated!")
         
         # 5. Progress tracking
-        if len(history) > 1:
-            first_score = history[0].get("damage_score", score)
+        if agg.count > 1:
+            first_score = agg.first.get("damage_score", score)
             delta = first_score - score
             
             if delta > 0:
@@ -347,7 +626,7 @@ def maya_analyze_latest_scan():
         response_text = "\n".join(analysis_parts)
         
         return {
-            "maya_response": clean_maya_response(response_text),
+            "maya_response": sanitize(response_text),
             "has_scan": True,
             "score": score,
             "actionable_items": len([p for p in analysis_parts if p.startswith("-")])
@@ -358,36 +637,35 @@ def maya_analyze_latest_scan():
         import traceback
         traceback.print_exc()
         return {
-            "maya_response": clean_maya_response("I'm having trouble analyzing right now, but I'm here to help! Try asking me a specific question!"),
+            "maya_response": sanitize("I'm having trouble analyzing right now, but I'm here to help! Try asking me a specific question!"),
             "has_scan": True
         }
 
 
 @app.get("/maya_progress")
-def maya_progress_report():
+def maya_progress_report(user: str = Depends(current_user)):
     """Maya gives a progress report comparing all scans."""
     try:
-        history = tracker.load_history()
+        agg = tracker.get_aggregates(user)
         
-        if len(history) < 2:
+        if agg.scored < 2:
             return {
-                "maya_response": clean_maya_response("You need at least 2 scans for me to track your progress! Keep scanning regularly so I can show you how far you've come!"),
+                "maya_response": sanitize("You need at least 2 scans for me to track your progress! Keep scanning regularly so I can show you how far you've come!"),
                 "has_scans": False
             }
         
         # Calculate statistics
-        scores = [h.get("damage_score", 0) for h in history]
-        first_score = scores[0]
-        latest_score = scores[-1]
-        avg_score = sum(scores) / len(scores)
-        best_score = min(scores)
-        worst_score = max(scores)
+        first_score = agg.first_score
+        latest_score = agg.last_score
+        avg_score = agg.avg
+        best_score = agg.score_min
+        worst_score = agg.score_max
         delta = first_score - latest_score
         
         # Build progress report
         report_parts = []
         
-        report_parts.append(f"Your Hair Health Journey ({len(history)} scans)")
+        report_parts.append(f"Your Hair Health Journey ({agg.count} scans)")
         report_parts.append(f"\n----------------------------")
         
         # Overall trend
@@ -428,10 +706,10 @@ def maya_progress_report():
         response_text = "\n".join(report_parts)
         
         return {
-            "maya_response": clean_maya_response(response_text),
+            "maya_response": sanitize(response_text),
             "delta": delta,
             "trend": "improving" if delta > 0 else "stable" if abs(delta) < 0.5 else "declining",
-            "total_scans": len(history)
+            "total_scans": agg.count
         }
         
     except Exception as e:
@@ -439,52 +717,51 @@ def maya_progress_report():
         import traceback
         traceback.print_exc()
         return {
-            "maya_response": clean_maya_response("I'm having trouble loading your progress right now, but I know you're doing great!"),
+            "maya_response": sanitize("I'm having trouble loading your progress right now, but I know you're doing great!"),
             "has_scans": True
         }
 
 
 @app.get("/maya_chat")
-def chat_with_maya_get(
+async def chat_with_maya_get(
     q: str,
     hair_type: str = "Medium",
     damage_score: float = 5.0,
-    concern: str = "Dryness"
+    concern: str = "Dryness",
+    user: str = Depends(current_user),
 ):
     """Enhanced Maya chat with context awareness"""
     try:
-        q_lower = q.lower()
-        
         # Route to specialized endpoints
-        if any(word in q_lower for word in ["progress", "improvement", "how am i doing", "journey"]):
-            return maya_progress_report()
-        
-        if any(word in q_lower for word in ["analyze", "latest scan", "my hair", "current"]):
-            return maya_analyze_latest_scan()
+        route = intents.route_for(q)
+        if route == "progress":
+            return await asyncio.to_thread(maya_progress_report, user)
         
-        # Get product info
-        product_info = get_matching_product(
-            hair_type=hair_type,
-            concern=concern,
-            damage_score=damage_score
-        )
+        if route == "analyze":
+            return await asyncio.to_thread(maya_analyze_latest_scan, user)
         
-        # Get Maya's response with enhanced context
-        reply = maya_chat(
-            q=q,
-            hair_type=hair_type,
-            damage_score=damage_score,
-            concern=concern,
-            tts=False
-        )
-        
-        reply = clean_maya_response(reply)
+        # Catalog questions are answered from templates, without the model
+        instant = intents.instant_answer(q, hair_type, damage_score, concern)
+        if instant is not None:
+            reply, product_info = instant
+        else:
+            # Get product info
+            product_info = get_matching_product(
+                hair_type=hair_type,
+                concern=concern,
+                damage_score=damage_score
+            )
+            
+            # Get Maya's response with enhanced context
+            reply = await maya_chat(
+                q=q,
+                hair_type=hair_type,
+                damage_score=damage_score,
+                concern=concern,
+                tts=False
+            )
         
-        # Make response more agent-like
-        if damage_score > 6.5:
-            reply = f"{reply}\n\nRemember, I'm here to help you every step of the way! Your hair will thank you!"
-        elif damage_score < 3.5:
-            reply = f"{reply}\n\nYou're doing amazing! Keep up the great work!"
+        reply = sanitize(reply) + maya_closing(damage_score)
         
         response_data = {
             "maya_response": reply,
@@ -496,12 +773,7 @@ def chat_with_maya_get(
         }
         
         if product_info:
-            response_data["matched_product"] = {
-                "name": f"Gliss {product_info['product_name']} {product_info['product_type']}",
-                "ingredients": product_info['ingredients'],
-                "benefit": product_info['benefit'],
-                "care_level": product_info['care_level']
-            }
+            response_data["matched_product"] = matched_product_payload(product_info)
         
         return response_data
         
@@ -510,7 +782,7 @@ def chat_with_maya_get(
         import traceback
         traceback.print_exc()
         return {
-            "maya_response": clean_maya_response("I'm having a little trouble right now, but I'm still here for you! Try asking me again!"),
+            "maya_response": sanitize("I'm having a little trouble right now, but I'm still here for you! Try asking me again!"),
             "context": {
                 "hair_type": hair_type,
                 "damage_score": damage_score,
@@ -519,6 +791,103 @@ def chat_with_maya_get(
         }
 
 
+def maya_closing(damage_score: float) -> str:
+    """Agent-style sign-off appended to Maya's chat replies."""
+    if damage_score > 6.5:
+        return "\n\nRemember, I'm here to help you every step of the way! Your hair will thank you!"
+    if damage_score < 3.5:
+        return "\n\nYou're doing amazing! Keep up the great work!"
+    return ""
+
+
+def matched_product_payload(product_info: dict) -> dict:
+    return {
+        "name": f"Gliss {product_info['product_name']} {product_info['product_type']}",
+        "ingredients": product_info['ingredients'],
+        "benefit": product_info['benefit'],
+        "care_level": product_info['care_level']
+    }
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/maya_chat_stream")
+async def chat_with_maya_stream(
+    q: str,
+    hair_type: str = "Medium",
+    damage_score: float = 5.0,
+    concern: str = "Dryness",
+    user: str = Depends(current_user),
+):
+    """
+    /maya_chat as Server-Sent Events, streamed while the model generates:
+    a `product` event with the matched product and context first, then
+    `delta` events ({"text": ...}) whose texts join into the reply, then
+    `done` with the full reply (or `error`).
+    """
+    context = {"hair_type": hair_type, "damage_score": damage_score, "concern": concern}
+
+    async def events():
+        # Routed questions answer from history at once, as in /maya_chat
+        route = intents.route_for(q)
+        if route == "progress":
+            routed = await asyncio.to_thread(maya_progress_report, user)
+        elif route == "analyze":
+            routed = await asyncio.to_thread(maya_analyze_latest_scan, user)
+        else:
+            routed = None
+
+        if routed is not None:
+            yield sse_event("product", {"matched_product": None, "context": context})
+            yield sse_event("delta", {"text": routed["maya_response"]})
+            yield sse_event("done", {"maya_response": routed["maya_response"]})
+            return
+
+        instant = intents.instant_answer(q, hair_type, damage_score, concern)
+        if instant is not None:
+            reply, product_info = instant
+            reply = sanitize(reply) + maya_closing(damage_score)
+            yield sse_event("product", {
+                "matched_product": matched_product_payload(product_info) if product_info else None,
+                "context": context,
+            })
+            yield sse_event("delta", {"text": reply})
+            yield sse_event("done", {"maya_response": reply})
+            return
+
+        product_info = get_matching_product(hair_type=hair_type, concern=concern, damage_score=damage_score)
+        yield sse_event("product", {
+            "matched_product": matched_product_payload(product_info) if product_info else None,
+            "context": context,
+        })
+
+        reply = []
+        try:
+            async for delta in maya_chat_stream(q=q, hair_type=hair_type, damage_score=damage_score, concern=concern):
+                reply.append(delta)
+                yield sse_event("delta", {"text": delta})
+        except Exception as e:
+            print(f"❌ Maya chat stream error: {e}")
+            yield sse_event("error", {
+                "maya_response": sanitize("I'm having a little trouble right now, but I'm still here for you! Try asking me again!")
+            })
+            return
+
+        closing = maya_closing(damage_score)
+        if closing:
+            reply.append(closing)
+            yield sse_event("delta", {"text": closing})
+        yield sse_event("done", {"maya_response": "".join(reply)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ==================== TEXT-TO-SPEECH ====================
 
 @app.options("/tts")
@@ -529,26 +898,26 @@ async def options_tts():
 
 @app.post("/tts")
 async def text_to_speech(request: TTSRequest):
-    """Convert text to speech using pyttsx3 and return audio file."""
+    """Convert text to speech, served from the content-addressed audio cache."""
     text = request.text or "Hello from Maya!"
-    filename = f"maya_voice_{datetime.now().timestamp()}.mp3"
     
     try:
-        engine = pyttsx3.init()
-        voices = engine.getProperty('voices')
-        if len(voices) > 1:
-            engine.setProperty('voice', voices[1].id)
-        engine.setProperty('rate', 150)
-        engine.save_to_file(text, filename)
-        engine.runAndWait()
-        
-        response = FileResponse(
-            filename,
-            media_type="audio/mpeg",
-            filename="maya_voice.mp3"
+        if request.stream:
+            return await stream_speech(text, request.voice, request.rate)
+
+        audio = await tts.speech_audio(text, voice=request.voice, rate=request.rate)
+        
+        kind = tts.audio_format(audio)
+        response = Response(
+            audio,
+            media_type=tts.MEDIA_TYPES[kind],
+            headers={"Content-Disposition": f'attachment; filename="maya_voice.{kind}"'}
         )
         return response
         
+    except tts.TTSBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(TTS_RETRY_AFTER)})
+
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -559,6 +928,31 @@ async def text_to_speech(request: TTSRequest):
         )
 
 
+async def stream_speech(text: str, voice: Optional[str], rate: Optional[int]) -> StreamingResponse:
+    """
+    Stream audio sentence by sentence (chunked transfer) as one WAV stream,
+    so playback can start after the first sentence. The first chunk is
+    rendered before the response starts, so failures still get a proper
+    status code.
+    """
+    chunks = tts.speech_stream(text, voice=voice, rate=rate)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    async def body():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Releases the stream's TTS slot even if the client went away
+            await chunks.aclose()
+
+    return StreamingResponse(body(), media_type=tts.MEDIA_TYPES["wav"])
+
+
 # ==================== ERROR HANDLERS ====================
 
 @app.exception_handler(404)
@@ -589,9 +983,38 @@ async def internal_error_handler(request: Request, exc):
 
 # ==================== STARTUP/SHUTDOWN EVENTS ====================
 
+def _on_catalog_reload(version: int) -> None:
+    """After a catalog hot reload, drop results and workers built on the old one."""
+    print(f"🔄 Gliss catalog reloaded (version {version})")
+    analysis_cache.clear()
+    maya_reply_cache.clear()
+    if _process_pool is not None:
+        # Running analyses finish on the old workers; new ones go to a pool
+        # that is already loading the new catalog
+        replace_process_pool(_process_pool)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Tasks to run on application startup"""
+    # Warm the catalog and its indexes so the first customer doesn't pay for them
+    load_recommendation_index()
+    load_match_engine()
+
+    # Spawn the analysis workers now; each loads the catalog as it starts
+    start_process_pool()
+
+    loop = asyncio.get_running_loop()
+    on_dataset_reload(lambda version: loop.call_soon_threadsafe(_on_catalog_reload, version))
+    watch_dataset(stop=_dataset_watch_stop)
+
+    # Load Maya's model in the background; the API does not wait for it
+    app.state.model_warmup = asyncio.create_task(warm_model())
+
+    # Open the audio cache and start the speech workers with their engines
+    tts.get_audio_cache()
+    tts.start()
+
     print("🚀 Gliss Mirror API started successfully")
     print("📍 API Documentation: http://localhost:8000/docs")
     print("📍 Alternative docs: http://localhost:8000/redoc")
@@ -601,14 +1024,12 @@ async def startup_event():
 async def shutdown_event():
     """Tasks to run on application shutdown"""
     print("👋 Gliss Mirror API shutting down...")
-    
-    for file in os.listdir("."):
-        if file.startswith("maya_voice_") and file.endswith(".mp3"):
-            try:
-                os.remove(file)
-                print(f"🗑️  Cleaned up: {file}")
-            except Exception as e:
-                print(f"⚠️  Could not delete {file}: {e}")
+
+    _dataset_watch_stop.set()
+
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+    tts.shutdown()
 
 
 # ==================== MAIN ====================
@@ -1,19 +1,238 @@
+import hashlib
 import json
 import os
-from datetime import datetime
-from typing import List, Dict, Any
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
 
-# Path to scan history file
+from scan_store import BACKENDS, GroupCommit, ScanStore
+from scan_stats import ScanAggregates
+
+# Legacy single-JSON history file; imported into the store on first use
 HISTORY_FILE = "scan_history.json"
 
+# Storage backend: "jsonl" (append-only log) or "sqlite" (WAL mode)
+HISTORY_BACKEND = "jsonl"
+HISTORY_PATHS = {
+    "jsonl": "scan_history.jsonl",
+    "sqlite": "scan_history.db",
+}
+
+# Scans are sharded per user/device id: DEFAULT_USER keeps the paths above,
+# every other user gets small files of their own under HISTORY_DIR, spread
+# over hashed subdirectories. Each shard has its own store and locks.
+# Evicted shards close their store; an open SQLite shard holds three file
+# descriptors (database, WAL, shared memory), so fewer of those stay open.
+DEFAULT_USER = "default"
+HISTORY_DIR = "scan_history"
+MAX_OPEN_SHARDS = 1024
+MAX_OPEN_SQLITE_SHARDS = 128
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.:@-]{1,128}$")
+
+
+class HistoryShard:
+    """
+    One user's scan history: its store, an in-memory snapshot and running
+    aggregates, each guarded by locks no other user contends on.
+    """
+
+    def __init__(self, path: str, legacy_file: Optional[str] = None):
+        self.path = path
+        self.aggregates_file = f"{os.path.splitext(path)[0]}.aggregates.json"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.store: ScanStore = BACKENDS[HISTORY_BACKEND](path)
+        if legacy_file:
+            self.store.migrate_from(legacy_file)
+        self.commits = GroupCommit(self.store)
+
+        # In-memory history: an immutable tuple, refreshed incrementally from
+        # the store when save() bumps saved_version or another process writes.
+        self._history: Tuple[Dict[str, Any], ...] = ()
+        self._history_version = 0
+        self._history_cursor = None
+        self._history_stamp = None
+        self._history_seen_saves = -1
+        self._saved_version = 0
+        self._history_lock = threading.Lock()
+        # Timestamp index over the same records: sorted (timestamp, seq) keys,
+        # seq being the position in store order, and the records in that order
+        self._timeline: Tuple[Tuple[Tuple[str, int], ...], Tuple[Dict[str, Any], ...]] = ((), ())
+
+        # Running aggregates, persisted next to the store with their cursor
+        self._aggregates: Optional[ScanAggregates] = None
+        self._aggregates_cursor = None
+        self._aggregates_stamp = None
+        self._aggregates_seen_saves = -1
+        self._aggregates_lock = threading.Lock()
+
+    def save(self, record: Dict[str, Any]) -> None:
+        self.commits.append(record)
+        with self._history_lock:
+            self._saved_version += 1
+        self.aggregates()
+
+    def snapshot(self) -> Tuple[int, Tuple[Dict[str, Any], ...]]:
+        with self._history_lock:
+            self._refresh()
+            return self._history_version, self._history
+
+    def revision(self) -> str:
+        """Token for the stored records behind the snapshot (the store cursor), stable across processes."""
+        with self._history_lock:
+            self._refresh()
+            return repr(self._history_cursor)
+
+    def timeline(self) -> Tuple[int, Tuple[Tuple[str, int], ...], Tuple[Dict[str, Any], ...]]:
+        """(version, sorted (timestamp, seq) keys, records in that order)."""
+        with self._history_lock:
+            self._refresh()
+            return (self._history_version,) + self._timeline
+
+    def _refresh(self) -> None:
+        saves = self._saved_version
+        stamp = self.store.stamp()
+        if saves == self._history_seen_saves and stamp == self._history_stamp:
+            return
+        records, cursor, reset = self.store.read_since(self._history_cursor)
+        if reset:
+            self._history = ()
+            self._timeline = ((), ())
+        if reset or records:
+            self._index(records)
+            self._history = self._history + tuple(records)
+            self._history_version += 1
+        self._history_cursor, self._history_stamp, self._history_seen_saves = cursor, stamp, saves
+
+    def _index(self, records: List[Dict[str, Any]]) -> None:
+        keys, ordered = self._timeline
+        seq = len(self._history)
+        entries = [((r.get("timestamp") or "", seq + i), r) for i, r in enumerate(records)]
+        # Saves arrive in timestamp order, so this is almost always an append
+        if any(a[0] > b[0] for a, b in zip(entries, entries[1:])) or (keys and entries and entries[0][0] < keys[-1]):
+            entries = sorted(list(zip(keys, ordered)) + entries, key=lambda e: e[0])
+            keys, ordered = (), ()
+        self._timeline = (
+            keys + tuple(key for key, _ in entries),
+            ordered + tuple(record for _, record in entries),
+        )
+
+    def aggregates(self) -> ScanAggregates:
+        with self._aggregates_lock:
+            if self._aggregates is None:
+                self._aggregates, self._aggregates_cursor = self._load_aggregates()
+
+            # As in _refresh: local saves always trigger a read, and the stamp
+            # is taken before reading, so it never claims unread records
+            saves = self._saved_version
+            stamp = self.store.stamp()
+            if saves != self._aggregates_seen_saves or stamp != self._aggregates_stamp:
+                records, cursor, reset = self.store.read_since(self._aggregates_cursor)
+                if reset or records:
+                    aggregates = ScanAggregates() if reset else self._aggregates.copy()
+                    for record in records:
+                        aggregates.add(record)
+                    self._persist_aggregates(aggregates, cursor)
+                    self._aggregates = aggregates
+                self._aggregates_cursor, self._aggregates_stamp = cursor, stamp
+                self._aggregates_seen_saves = saves
+            return self._aggregates
+
+    def _load_aggregates(self) -> Tuple[ScanAggregates, Any]:
+        try:
+            with open(self.aggregates_file, "r") as f:
+                data = json.load(f)
+            if data.get("backend") == HISTORY_BACKEND:
+                cursor = data["cursor"]
+                if isinstance(cursor, list):
+                    cursor = tuple(cursor)
+                return ScanAggregates.from_dict(data["aggregates"]), cursor
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Ignoring saved aggregates in {self.aggregates_file}: {e}")
+        return ScanAggregates(), None
+
+    def _persist_aggregates(self, aggregates: ScanAggregates, cursor: Any) -> None:
+        tmp = f"{self.aggregates_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"backend": HISTORY_BACKEND, "cursor": cursor, "aggregates": aggregates.to_dict()}, f)
+            os.replace(tmp, self.aggregates_file)
+        except OSError as e:
+            print(f"⚠️ Could not persist aggregates: {e}")
+
+
+_shards: "OrderedDict[str, HistoryShard]" = OrderedDict()
+_shards_lock = threading.Lock()
+# One lock per shard being opened, so a shard is built (and the legacy file
+# migrated) exactly once without holding the registry lock meanwhile
+_opening: Dict[str, threading.Lock] = {}
+
+
+def validate_user_id(user_id: Optional[str]) -> str:
+    """Return a usable user id (DEFAULT_USER when empty); raise ValueError if malformed."""
+    if not user_id:
+        return DEFAULT_USER
+    if not USER_ID_PATTERN.match(user_id):
+        raise ValueError(f"Invalid user id: {user_id!r}")
+    return user_id
+
+
+def shard_path(user_id: str) -> str:
+    """Store path for a user; ids are hashed so any id maps to a safe file name."""
+    default_path = HISTORY_PATHS[HISTORY_BACKEND]
+    if user_id == DEFAULT_USER:
+        return default_path
+    digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(HISTORY_DIR, digest[:2], digest + os.path.splitext(default_path)[1])
+
+
+def get_shard(user_id: str = DEFAULT_USER) -> HistoryShard:
+    """Open (or reuse) a user's shard. The default user migrates HISTORY_FILE on first use."""
+    user_id = validate_user_id(user_id)
+    with _shards_lock:
+        shard = _shards.get(user_id)
+        if shard is not None:
+            _shards.move_to_end(user_id)
+            return shard
+        opening = _opening.setdefault(user_id, threading.Lock())
+    # Opening touches the filesystem; do it under the shard's own lock only
+    with opening:
+        with _shards_lock:
+            shard = _shards.get(user_id)
+        if shard is None:
+            shard = HistoryShard(shard_path(user_id), HISTORY_FILE if user_id == DEFAULT_USER else None)
+        with _shards_lock:
+            shard = _shards.setdefault(user_id, shard)
+            _shards.move_to_end(user_id)
+            if _opening.get(user_id) is opening:
+                del _opening[user_id]
+            limit = MAX_OPEN_SQLITE_SHARDS if HISTORY_BACKEND == "sqlite" else MAX_OPEN_SHARDS
+            evicted = [_shards.popitem(last=False)[1] for _ in range(len(_shards) - limit)]
+    # A request still holding an evicted shard reopens its store on next use
+    for old in evicted:
+        old.store.close()
+    return shard
+
+
+def get_store(user_id: str = DEFAULT_USER) -> ScanStore:
+    """Open a user's history store."""
+    return get_shard(user_id).store
+
 
 # ------------------------------
 # 📦 SAVE SCAN
 # ------------------------------
-def save_scan(result: Dict[str, Any]) -> None:
+def save_scan(result: Dict[str, Any], user_id: str = DEFAULT_USER) -> bool:
     """
-    Save a single scan result to the history file.
+    Append a single scan result to the user's history shard.
     Compatible with both Streamlit and FastAPI usage.
+
+    Concurrent saves are group-committed: the call returns once the record
+    is durably stored. Returns False if it could not be saved.
     """
     try:
         # ✅ Normalize key names - handle both 'score' and 'damage_score'
@@ -29,61 +248,176 @@ def save_scan(result: Dict[str, Any]) -> None:
             "care_level": result.get("care_level", "N/A"),
         }
 
-        history = load_history()
-        history.append(record)
-
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=4)
+        get_shard(user_id).save(record)
 
         print(f"✅ Saved scan at {record['timestamp']} (Score: {record['damage_score']})")
+        return True
 
     except Exception as e:
         print(f"⚠️ Failed to save scan: {e}")
         import traceback
         traceback.print_exc()
+        return False
 
 
 # ------------------------------
 # 📖 LOAD HISTORY
 # ------------------------------
-def load_history() -> List[Dict[str, Any]]:
-    """Load all scan history records."""
+def history_snapshot(user_id: str = DEFAULT_USER) -> Tuple[int, Tuple[Dict[str, Any], ...]]:
+    """
+    Return (version, records) for a user's history without re-parsing it.
+
+    The snapshot is only refreshed when this process saved a scan or the
+    store's file stamp changed (another process wrote to it), and then only
+    the newly appended records are read. `version` changes whenever the
+    snapshot does. Records are shared - treat them as read-only.
+    """
+    return get_shard(user_id).snapshot()
+
+
+def get_history(user_id: str = DEFAULT_USER) -> Tuple[Dict[str, Any], ...]:
+    """Read-only view of a user's scan records, served from memory."""
     try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, "r") as f:
-                data = json.load(f)
-                # Ensure it's a list
-                if isinstance(data, list):
-                    return data
-                print("⚠️ History file is not a list - resetting")
-                return []
-        return []
-    except json.JSONDecodeError:
-        print("⚠️ History file corrupted – resetting.")
-        return []
+        return history_snapshot(user_id)[1]
+    except ValueError:
+        raise
     except Exception as e:
         print(f"⚠️ Failed to load history: {e}")
-        return []
+        return ()
+
+
+def history_revision(user_id: str = DEFAULT_USER) -> str:
+    """Changes whenever the user's stored history does; used for ETags."""
+    return get_shard(user_id).revision()
+
+
+def load_history(user_id: str = DEFAULT_USER) -> List[Dict[str, Any]]:
+    """Load all scan history records."""
+    return list(get_history(user_id))
+
+
+# ------------------------------
+# 📑 PAGINATION & DELTA SYNC
+# ------------------------------
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 500
+_LAST_SEQ = float("inf")
+
+
+def normalize_timestamp(value: str) -> str:
+    """Parse an ISO timestamp into the stored form (naive UTC isoformat)."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def encode_cursor(key: Tuple[str, int]) -> str:
+    return f"{key[0]}~{key[1]}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    timestamp, sep, seq = cursor.rpartition("~")
+    if not sep:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return timestamp, int(seq)
+
+
+def query_history(
+    user_id: str = DEFAULT_USER,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    descending: bool = False,
+) -> Dict[str, Any]:
+    """
+    One page of a user's history from the timestamp index.
+
+    `since` keeps records strictly newer than a timestamp, `start`/`end`
+    bound an inclusive time range and `cursor` continues after the last
+    page (or before it, when `descending`). `next_cursor` is returned even
+    on the final page, so clients can poll with it and fetch only new
+    records. Each page is found by bisection and costs O(limit).
+    """
+    version, keys, records = get_shard(user_id).timeline()
+    lo, hi = 0, len(keys)
+    if since is not None:
+        lo = max(lo, bisect_right(keys, (normalize_timestamp(since), _LAST_SEQ)))
+    if start is not None:
+        lo = max(lo, bisect_left(keys, (normalize_timestamp(start), -1)))
+    if end is not None:
+        hi = min(hi, bisect_right(keys, (normalize_timestamp(end), _LAST_SEQ)))
+    if cursor is not None:
+        key = decode_cursor(cursor)
+        if descending:
+            hi = min(hi, bisect_left(keys, key))
+        else:
+            lo = max(lo, bisect_right(keys, key))
+
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    if descending:
+        first = max(lo, hi - limit)
+        page, has_more = records[first:hi][::-1], first > lo
+        last_key = keys[first] if page else None
+    else:
+        stop = min(hi, lo + limit)
+        page, has_more = records[lo:stop], stop < hi
+        last_key = keys[stop - 1] if page else None
+
+    return {
+        "items": list(page),
+        "next_cursor": encode_cursor(last_key) if last_key else cursor,
+        "has_more": has_more,
+        "version": version,
+    }
+
+
+# ------------------------------
+# 🧮 RUNNING AGGREGATES
+# ------------------------------
+def get_aggregates(user_id: str = DEFAULT_USER) -> ScanAggregates:
+    """
+    Running aggregates over a user's history, answered without a scan.
+
+    Only records appended since the last call are folded in (O(1) per
+    save). A fresh process resumes from the persisted aggregates and their
+    store cursor; if the store was rewritten they are rebuilt. The returned
+    object is never mutated afterwards - treat it as read-only.
+    """
+    return get_shard(user_id).aggregates()
+
+
+def history_view(user_id: str = DEFAULT_USER) -> Tuple[int, Tuple[Dict[str, Any], ...], ScanAggregates]:
+    """
+    (version, records, aggregates) that all describe the same snapshot.
+
+    The running aggregates are used when they cover exactly the snapshot's
+    records. If a save landed between the two reads, the aggregates are
+    folded from the snapshot itself in one pass.
+    """
+    shard = get_shard(user_id)
+    version, records = shard.snapshot()
+    aggregates = shard.aggregates()
+    if aggregates.count != len(records):
+        aggregates = ScanAggregates()
+        for record in records:
+            aggregates.add(record)
+    return version, records, aggregates
 
 
 # ------------------------------
 # 📊 STATS CALCULATION
 # ------------------------------
-def get_stats() -> Dict[str, Any]:
+def get_stats(user_id: str = DEFAULT_USER) -> Dict[str, Any]:
     """Return average, best, worst, and trend info."""
-    history = load_history()
-    if not history:
-        return {
-            "avg": 0,
-            "best": 0,
-            "worst": 0,
-            "trend": "No Data",
-            "total_scans": 0,
-        }
+    return stats_view(get_aggregates(user_id))
 
-    scores = [scan["damage_score"] for scan in history if scan.get("damage_score") is not None]
 
-    if not scores:
+def stats_view(agg: ScanAggregates) -> Dict[str, Any]:
+    """Build the stats payload from aggregates."""
+    if not agg.scored:
         return {
             "avg": 0,
             "best": 0,
@@ -92,32 +426,28 @@ def get_stats() -> Dict[str, Any]:
             "total_scans": 0,
         }
 
-    avg = round(sum(scores) / len(scores), 1)
-    best = min(scores)
-    worst = max(scores)
-    trend = "⬆️ Improving" if len(scores) > 1 and scores[-1] < scores[0] else "⬇️ Declining"
+    trend = "⬆️ Improving" if agg.scored > 1 and agg.last_score < agg.first_score else "⬇️ Declining"
 
     return {
-        "avg": avg,
-        "best": best,
-        "worst": worst,
+        "avg": round(agg.avg, 1),
+        "best": agg.score_min,
+        "worst": agg.score_max,
         "trend": trend,
-        "total_scans": len(scores),
+        "total_scans": agg.scored,
     }
 
 
 # ------------------------------
 # 🔍 COMPARISON
 # ------------------------------
-def get_comparison() -> Dict[str, Any]:
+def get_comparison(user_id: str = DEFAULT_USER) -> Dict[str, Any]:
     """Compare first and latest scans."""
-    history = load_history()
-    if len(history) < 2:
+    agg = get_aggregates(user_id)
+    if agg.count < 2:
         return {"first": None, "latest": None, "delta": 0}
 
-    sorted_history = sorted(history, key=lambda x: x["timestamp"])
-    first = sorted_history[0]
-    latest = sorted_history[-1]
+    first = agg.earliest
+    latest = agg.latest
     delta = round(first["damage_score"] - latest["damage_score"], 2)  # ✅ Fixed: first - latest
 
     return {
@@ -131,12 +461,11 @@ def get_comparison() -> Dict[str, Any]:
 # ------------------------------
 # 🧠 INSIGHT GENERATION (used by /insights)
 # ------------------------------
-def get_insight_summary() -> Dict[str, Any]:
+def get_insight_summary(user_id: str = DEFAULT_USER) -> Dict[str, Any]:
     """
     Generate a high-level summary for the /insights endpoint.
     """
-    history = load_history()
-    if not history:
+    if not get_aggregates(user_id).count:
         return {
             "message": "No scans available yet.",
             "average_score": 0,
@@ -148,8 +477,8 @@ def get_insight_summary() -> Dict[str, Any]:
             "insight": "Start analyzing your hair to see insights! 💫"
         }
 
-    stats = get_stats()
-    comparison = get_comparison()
+    stats = get_stats(user_id)
+    comparison = get_comparison(user_id)
 
     if comparison["first"] and comparison["latest"]:
         delta = comparison["delta"]
@@ -0,0 +1,472 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import struct
+import threading
+import time
+import wave
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import pyttsx3
+
+from cache import SingleFlight
+
+# --------------------------------------------------------------------
+# CONFIG
+# --------------------------------------------------------------------
+AUDIO_CACHE_DIR = "audio_cache"
+AUDIO_CACHE_BYTES = 128 * 1024 * 1024
+
+TTS_VOICE: Optional[str] = None  # voice id; None picks the second installed voice, as before
+TTS_RATE = 150
+TTS_RATE_RANGE = (80, 300)
+
+STALE_TEMP_AGE = 600  # seconds before an unfinished render is considered abandoned
+
+# Streaming mode: text is split into sentences rendered (and cached) one by
+# one; fragments shorter than TTS_STREAM_MIN_CHARS are merged into the next
+TTS_STREAM_MIN_CHARS = 24
+TTS_STREAM_LOOKAHEAD = 2  # sentences queued for synthesis ahead of playback
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+_CACHE_FILE = re.compile(r"^tts_[0-9a-f]{32}\.mp3$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+# --------------------------------------------------------------------
+# KEYS
+# --------------------------------------------------------------------
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different texts share audio."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text at sentence ends and line breaks, merging tiny fragments."""
+    chunks, pending = [], ""
+    for part in _SENTENCE_BREAK.split(text):
+        pending = f"{pending} {normalize_text(part)}".strip()
+        if len(pending) >= TTS_STREAM_MIN_CHARS:
+            chunks.append(pending)
+            pending = ""
+    if pending:
+        chunks.append(pending)
+    return chunks
+
+
+def audio_key(text: str, voice: Optional[str], rate: int) -> str:
+    """Content address of a rendering: hash of (normalized text, voice, rate)."""
+    payload = f"{voice or ''}\x00{rate}\x00{normalize_text(text)}"
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# --------------------------------------------------------------------
+# AUDIO FORMATS
+# --------------------------------------------------------------------
+# pyttsx3 writes whatever its driver produces: WAV with eSpeak and SAPI5,
+# AIFF with macOS NSSpeechSynthesizer (cache files keep the .mp3 suffix)
+MEDIA_TYPES = {"wav": "audio/wav", "aiff": "audio/aiff", "mp3": "audio/mpeg"}
+
+# (channels, sample width in bytes, frame rate)
+PCMFormat = Tuple[int, int, int]
+
+
+def audio_format(data: bytes) -> str:
+    """"wav", "aiff" or "mp3", from the audio's magic bytes."""
+    head = data[:12]
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    return "mp3"
+
+
+def read_pcm(data: bytes) -> Tuple[PCMFormat, bytes]:
+    """Format and raw little-endian PCM frames (WAV layout) of WAV or AIFF audio."""
+    if audio_format(data) == "wav":
+        with wave.open(io.BytesIO(data), "rb") as w:
+            return (w.getnchannels(), w.getsampwidth(), w.getframerate()), w.readframes(w.getnframes())
+    return _read_aiff(data)
+
+
+def _read_aiff(data: bytes) -> Tuple[PCMFormat, bytes]:
+    compressed = data[8:12] == b"AIFC"
+    fmt, frames, pos = None, None, 12
+    while pos + 8 <= len(data):
+        chunk_id, size = data[pos:pos + 4], struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        body = data[pos + 8:pos + 8 + size]
+        if chunk_id == b"COMM":
+            channels, _, bits = struct.unpack(">hIh", body[:8])
+            exponent, mantissa = struct.unpack(">HQ", body[8:18])
+            rate = round(mantissa * 2.0 ** ((exponent & 0x7FFF) - 16383 - 63))
+            encoding = body[18:22] if compressed else b"NONE"
+            if encoding not in (b"NONE", b"sowt"):
+                raise ValueError(f"unsupported AIFF-C encoding {encoding!r}")
+            fmt = (channels, (bits + 7) // 8, rate)
+        elif chunk_id == b"SSND":
+            offset = struct.unpack(">I", body[:4])[0]
+            frames = body[8 + offset:]
+        pos += 8 + size + (size & 1)
+    if fmt is None or frames is None:
+        raise ValueError("AIFF file without COMM or SSND chunk")
+
+    width = fmt[1]
+    if width == 1:
+        # AIFF 8-bit is signed, WAV 8-bit unsigned
+        frames = frames.translate(bytes((i + 128) & 0xFF for i in range(256)))
+    elif encoding != b"sowt":
+        # Big-endian samples to little-endian
+        swapped = bytearray(len(frames))
+        for k in range(width):
+            swapped[k::width] = frames[width - 1 - k::width]
+        frames = bytes(swapped)
+    return fmt, frames
+
+
+def wav_stream_header(fmt: PCMFormat) -> bytes:
+    """WAV header for a stream of unknown length (sizes set to the maximum)."""
+    channels, width, rate = fmt
+    return b"".join([
+        b"RIFF", struct.pack("<I", 0xFFFFFFFF), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, channels, rate, rate * channels * width, channels * width, width * 8),
+        b"data", struct.pack("<I", 0xFFFFFFFF - 36),
+    ])
+
+
+# --------------------------------------------------------------------
+# DISK CACHE
+# --------------------------------------------------------------------
+class AudioCache:
+    """
+    Content-addressed `tts_<key>.mp3` files in one directory, evicted
+    least-recently-used once their total size exceeds `max_bytes`.
+    Recency survives restarts through file mtimes.
+
+    Audio is handed out as bytes read through a handle opened under the
+    lock, so an eviction racing a request can never delete a file between
+    lookup and serving; a file removed behind the cache's back is a miss.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"tts_{key}.mp3")
+
+    def temp_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"tmp_{key}_{os.getpid()}_{threading.get_ident()}.mp3")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The cached audio for `key`, or None on a miss."""
+        path = self.path(key)
+        with self._lock:
+            try:
+                f = open(path, "rb") if key in self._entries else None
+            except FileNotFoundError:
+                f = None
+            if f is None:
+                self._forget(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        # The open handle stays readable even if the entry is evicted meanwhile
+        with f:
+            return f.read()
+
+    def put(self, key: str, temp_path: str) -> bytes:
+        """Move a finished rendering into the cache, evict down to the cap and return its audio."""
+        path = self.path(key)
+        with self._lock:
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+            f = open(path, "rb")
+            self._forget(key)
+            self._entries[key] = size
+            self._bytes += size
+            # Never evict the entry just added, even if it alone exceeds the cap
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old, _ = next(iter(self._entries.items()))
+                self._forget(old)
+                try:
+                    os.remove(self.path(old))
+                except OSError:
+                    pass
+        with f:
+            return f.read()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _forget(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _load(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if _CACHE_FILE.match(entry.name):
+                st = entry.stat()
+                files.append((st.st_mtime, entry.name[4:-4], st.st_size))
+            elif entry.name.startswith("tmp_") and time.time() - entry.stat().st_mtime > STALE_TEMP_AGE:
+                # Left behind by an interrupted synthesis
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+
+# --------------------------------------------------------------------
+# SPEECH WORKERS
+# --------------------------------------------------------------------
+# pyttsx3 engines are not thread-safe and pyttsx3.init() hands back one
+# shared engine per process, so synthesis runs in dedicated worker
+# processes, each holding an engine initialized once. Jobs wait for one of
+# TTS_WORKERS job slots before they reach the pool, so a job in the pool is
+# running and TTS_JOB_TIMEOUT bounds its run time alone. Admission is counted per
+# request, not per job: TTS_WORKERS + TTS_QUEUE_DEPTH requests that need
+# synthesis may be in progress, beyond that TTSBusy is raised. A streamed
+# request is one admission for its whole duration, however many sentences
+# it queues (at most TTS_STREAM_LOOKAHEAD + 1 at a time).
+TTS_WORKERS = 1
+TTS_QUEUE_DEPTH = 32
+TTS_JOB_TIMEOUT = 60  # seconds a job may run before its worker is presumed hung
+
+
+class TTSBusy(RuntimeError):
+    """Raised when the speech queue is full."""
+
+
+_audio_cache: Optional[AudioCache] = None
+_flights = SingleFlight()
+_pool: Optional[ProcessPoolExecutor] = None
+_job_slots: Optional[asyncio.Semaphore] = None
+_in_flight = 0
+
+# Worker-process state
+_engine = None
+_default_voice: Optional[str] = None
+
+
+def _init_worker() -> None:
+    global _engine, _default_voice
+    _engine = pyttsx3.init()
+    voices = _engine.getProperty('voices')
+    if len(voices) > 1:
+        _default_voice = voices[1].id
+
+
+def _ping() -> bool:
+    return _engine is not None
+
+
+def _render(text: str, path: str, voice: Optional[str], rate: int) -> None:
+    """Render `text` to `path` with this worker's engine (runs in the worker)."""
+    if _engine is None:
+        _init_worker()
+    _engine.setProperty('voice', voice or _default_voice or _engine.getProperty('voice'))
+    _engine.setProperty('rate', rate)
+    _engine.save_to_file(text, path)
+    _engine.runAndWait()
+
+
+def get_audio_cache() -> AudioCache:
+    """Open the audio cache on first use (never in worker processes)."""
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_BYTES)
+    return _audio_cache
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=TTS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _pool
+
+
+def start() -> None:
+    """Spawn the workers now so their engines are ready before the first request."""
+    def report(future) -> None:
+        if future.exception() is not None:
+            print(f"⚠️ TTS worker failed to start: {future.exception()!r}")
+
+    _get_pool().submit(_ping).add_done_callback(report)
+
+
+def shutdown() -> None:
+    global _pool, _job_slots
+    _job_slots = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+@contextmanager
+def admitted():
+    """Hold one request slot for the block; raises TTSBusy if none is free."""
+    global _in_flight
+    if _in_flight >= TTS_WORKERS + TTS_QUEUE_DEPTH:
+        raise TTSBusy("Speech queue is full, please retry shortly")
+    _in_flight += 1
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+
+
+async def synthesize(text: str, path: str, voice: Optional[str], rate: int) -> None:
+    """
+    Render on the speech workers once a job slot is free. A rendering that
+    runs longer than TTS_JOB_TIMEOUT is presumed hung: the workers are
+    killed and replaced, and the slot is freed.
+    """
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(TTS_WORKERS)
+    slots = _job_slots
+    await slots.acquire()
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        job = pool.submit(_render, text, path, voice, rate)
+    except BaseException as e:
+        slots.release()
+        if isinstance(e, BrokenProcessPool):
+            _recycle_pool(pool)
+        raise
+    # The slot is freed when the worker is, even if the caller has gone
+    job.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release))
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(job), TTS_JOB_TIMEOUT)
+    except BrokenProcessPool:
+        # A worker died; start fresh ones for the next job
+        _recycle_pool(pool)
+        raise
+    except asyncio.TimeoutError:
+        _recycle_pool(pool, kill=True)
+        raise RuntimeError(f"speech engine did not finish within {TTS_JOB_TIMEOUT}s")
+
+
+def _recycle_pool(pool: ProcessPoolExecutor, kill: bool = False) -> None:
+    """Retire `pool`; the next job starts fresh workers. `kill` stops hung workers too."""
+    global _pool
+    if kill:
+        # The executor cannot interrupt a running job; its other jobs fail with BrokenProcessPool
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False)
+    if _pool is pool:
+        _pool = None
+
+
+async def speech_audio(text: str, voice: Optional[str] = None, rate: Optional[int] = None) -> bytes:
+    """
+    The cached audio for `text`, synthesizing it on a miss.
+    Concurrent requests for the same rendering share one synthesis. A miss
+    takes a request slot (see admitted) unless `admit` is False because
+    the caller already holds one.
+    """
+    return await _speech_audio(text, voice, rate, admit=True)
+
+
+async def _speech_audio(text: str, voice: Optional[str], rate: Optional[int], admit: bool) -> bytes:
+    voice = voice or TTS_VOICE
+    rate = min(max(rate or TTS_RATE, TTS_RATE_RANGE[0]), TTS_RATE_RANGE[1])
+    text = normalize_text(text)
+    key = audio_key(text, voice, rate)
+    audio_cache = get_audio_cache()
+
+    audio = audio_cache.get(key)
+    if audio is not None:
+        return audio
+
+    async def render() -> bytes:
+        temp = audio_cache.temp_path(key)
+        try:
+            with admitted() if admit else nullcontext():
+                await synthesize(text, temp, voice, rate)
+            if not os.path.exists(temp) or os.path.getsize(temp) == 0:
+                raise RuntimeError("speech engine produced no audio")
+            return audio_cache.put(key, temp)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    return await _flights.run(key, render)
+
+
+async def speech_stream(text: str, voice: Optional[str] = None, rate: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Yield one WAV stream sentence by sentence, in order, as soon as each is
+    ready: a header first, then each sentence's raw PCM frames, so players
+    see one continuous stream rather than concatenated files.
+
+    Every sentence is its own cached rendering, so repeated sentences
+    (greetings, tips) are never synthesized twice. The next
+    TTS_STREAM_LOOKAHEAD sentences are queued while the current one plays.
+    The whole stream holds a single request slot.
+    """
+    sentences = iter(split_sentences(text))
+    pending: Deque[asyncio.Future] = deque()
+
+    def schedule() -> None:
+        sentence = next(sentences, None)
+        if sentence is not None:
+            pending.append(asyncio.ensure_future(_speech_audio(sentence, voice, rate, admit=False)))
+
+    with admitted():
+        for _ in range(TTS_STREAM_LOOKAHEAD + 1):
+            schedule()
+        stream_fmt = None
+        try:
+            while pending:
+                audio = await pending.popleft()
+                schedule()
+                fmt, frames = read_pcm(audio)
+                if stream_fmt is None:
+                    stream_fmt = fmt
+                    frames = wav_stream_header(fmt) + frames
+                elif fmt != stream_fmt:
+                    # Same engine, voice and rate for every sentence, so never expected
+                    raise RuntimeError(f"sentence audio format {fmt} differs from stream format {stream_fmt}")
+                yield frames
+        finally:
+            # Renders already queued still finish and land in the cache
+            for future in pending:
+                future.cancel()